@@ -0,0 +1,517 @@
+"""
+Benchmark harness for compile.py.
+
+Generates a synthetic portfolio in a scratch directory – entries spread over
+themes and years, PIL images, short ffmpeg `testsrc` videos and .yt files
+whose thumbnails come from a local stub server – then times every compile
+stage twice: cold (fresh tree, no caches) and warm (straight after, every
+cache populated). The YouTube fetcher is checked against the stub first
+(hit, 404, connection error) and every pass checks that the .yt entries
+came out with their thumbnails; a failed check stops the run.
+
+Each run is appended to a JSON-lines history and compared with the last run
+on the same corpus, so regressions show up next to the numbers.
+
+    python bench.py --entries 40 --images 3 --videos 1 --youtube 4 -j 4
+
+`recommend` times the recommendation engines alone on synthetic catalogs
+of each --sizes; the python engine is timed on --python-rows rows and
+extrapolated past that, and checked against the numpy engine's output. The
+index engine is timed with its candidate tuning and its recall against the
+numpy engine is reported.
+
+    python bench.py recommend --sizes 1000,10000,50000
+
+`dimensions` times the header-only dimension parser against the PIL /
+ffprobe path it saves, per format, on the media under --media-dir plus a
+generated animated GIF and WebP, and checks that both agree.
+
+    python bench.py dimensions --media-dir entries
+"""
+import argparse
+import copy
+import http.server
+import importlib
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+REPO_DIR = Path(__file__).resolve().parent
+HISTORY_PATH = REPO_DIR / 'bench_history.jsonl'
+THEMES = ['design', 'game', 'blog', 'wikar']
+WORDS = ('timber pavilion facade courtyard lattice parametric survey heritage '
+         'scan point cloud render shader engine level puzzle prototype city '
+         'urban memory archive drawing model workshop festival installation '
+         'light shadow material grid network map photogrammetry landscape').split()
+# A stage slower than the previous run by more than this is flagged
+REGRESSION_THRESHOLD = 0.10
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+def make_image(path, rng):
+    """Gradient plus noise: compresses like a photo, so big sizes cross the
+    compression threshold."""
+    width = rng.choice([640, 1280, 2400, 3200])
+    height = int(width * rng.choice([0.5625, 0.75, 1.0, 1.333]))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), rng.uniform(20, 60))
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    img.save(path, quality=95)
+
+def make_video(path, rng):
+    size = rng.choice(['640x360', '480x480', '360x640'])
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', f'testsrc=size={size}:rate=25:duration=1',
+                    '-pix_fmt', 'yuv420p', path], check=True)
+
+def make_corpus(root, n_entries, n_images, n_videos, n_youtube, seed=1):
+    """Write entries/<theme>.json and the media folders; returns the entries."""
+    rng = random.Random(seed)
+    have_ffmpeg = shutil.which('ffmpeg') is not None
+    if n_videos and not have_ffmpeg:
+        print("  ffmpeg not on PATH – generating no videos")
+    entries = []
+    for i in range(n_entries):
+        theme = THEMES[i % len(THEMES)]
+        entry = {
+            'id': f'bench-{i:04d}',
+            'title': ' '.join(rng.sample(WORDS, 3)).title(),
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(20, 80))),
+            'tags': ','.join(rng.sample(WORDS, 3)),
+            'year': str(rng.randint(2012, 2025)),
+            'theme': theme if rng.random() < 0.8 else f'{theme}, {rng.choice(THEMES)}',
+            'locked': rng.random() < 0.05,
+        }
+        folder = root / 'entries' / theme / entry['id']
+        folder.mkdir(parents=True, exist_ok=True)
+        # The first YouTube entries get a .yt file as their first (thumbnail) file
+        if i < n_youtube:
+            video_id = f'dead{i:07d}' if i % 4 == 3 else f'bench{i:06d}'
+            (folder / '0_video.yt').write_text(f'https://www.youtube.com/watch?v={video_id}\n')
+        for m in range(n_images):
+            make_image(folder / f'{m + 1}_image{m}.{"png" if m % 3 == 2 else "jpg"}', rng)
+        for v in range(n_videos if have_ffmpeg else 0):
+            make_video(str(folder / f'{n_images + v + 1}_clip{v}.mp4'), rng)
+        entries.append(entry)
+
+    by_theme = {}
+    for entry in entries:
+        by_theme.setdefault(entry['theme'].split(',')[0].strip(), []).append(entry)
+    for theme, theme_entries in by_theme.items():
+        with open(root / 'entries' / f'{theme}.json', 'w') as f:
+            json.dump(theme_entries, f, indent=2)
+    (root / 'entries' / 'compiled').mkdir(parents=True, exist_ok=True)
+    (root / 'favicon.ico').write_bytes(b'\0' * 64)
+    shutil.copy(REPO_DIR / 'compile.py', root / 'compile.py')
+    return entries
+
+class YouTubeStub(http.server.BaseHTTPRequestHandler):
+    """Stands in for img.youtube.com: maxresdefault is missing for every id,
+    hqdefault exists unless the id starts with 'dead'."""
+    latency = 0.05
+    thumbnail = None
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        video_id, quality = self.path.strip('/').split('/')[-2:]
+        if video_id.startswith('dead') or quality == 'maxresdefault.jpg':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.thumbnail)))
+        self.end_headers()
+        self.wfile.write(self.thumbnail)
+
+    def log_message(self, *args):
+        pass
+
+def start_youtube_stub(root):
+    thumb_path = root / 'stub.jpg'
+    Image.linear_gradient('L').resize((480, 360)).convert('RGB').save(thumb_path, quality=90)
+    YouTubeStub.thumbnail = thumb_path.read_bytes()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), YouTubeStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/vi'
+
+# ---------------------------------------------------------------------------
+# Checks
+# ---------------------------------------------------------------------------
+def check_youtube_thumbnails(data, root):
+    """Every .yt entry the stub serves must come out of process_entries
+    with a downloaded thumbnail, the dead ids without one."""
+    wrong = []
+    for entry in data:
+        folder = root / 'entries' / entry['theme'].split(',')[0].strip() / entry['id']
+        yt_file = folder / '0_video.yt'
+        if not yt_file.exists():
+            continue
+        video_id = yt_file.read_text().strip().split('v=')[-1]
+        has_thumbnail = entry['thumbnail_override'].startswith('static/thumbs/')
+        if has_thumbnail == video_id.startswith('dead'):
+            wrong.append(f"{entry['id']} ({video_id}): thumbnail_override={entry['thumbnail_override']!r}")
+    if wrong:
+        raise SystemExit("YouTube thumbnails wrong for:\n  " + "\n  ".join(wrong))
+
+def check_youtube_fetch(c, root, youtube_url):
+    """The fetcher against the stub and a closed port: a hit is saved, a 404
+    goes into the negative cache, a connection error does not."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        closed_url = f'http://127.0.0.1:{sock.getsockname()[1]}/vi'
+    out_dir = root / 'fetch_check'
+    out_dir.mkdir(exist_ok=True)
+    cache = c.MediaCache(str(out_dir / 'cache.sqlite'))
+    wrong = []
+    for video_id, base_url, expected in (('bench999999', youtube_url, True),
+                                         ('dead9999999', youtube_url, False),
+                                         ('bench999998', closed_url, None)):
+        got = c.download_youtube_thumbnail(video_id, str(out_dir / f'{video_id}.jpg'), base_url=base_url)
+        if got is not expected:
+            wrong.append(f"download_youtube_thumbnail({video_id}) returned {got}, expected {expected}")
+        for path in out_dir.glob('*.jpg'):
+            path.unlink()
+        fetched = c.fetch_youtube_thumbnails([video_id], str(out_dir), base_url=base_url, cache=cache)
+        remembered = cache.recent_failure(f'youtube:{video_id}')
+        if bool(fetched[video_id]) != bool(expected) or remembered != (expected is False):
+            wrong.append(f"fetch_youtube_thumbnails({video_id}) gave {fetched[video_id]!r}, "
+                         f"negative cache {'set' if remembered else 'not set'}")
+    if wrong:
+        raise SystemExit("YouTube fetcher wrong:\n  " + "\n  ".join(wrong))
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+def timed(results, stage, fn, *args, **kwargs):
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    results[stage] = round(time.perf_counter() - start, 4)
+    return value
+
+def media_files(root):
+    """The generated images and videos, relative to root."""
+    media = [f for f in (root / 'entries').rglob('*')
+             if f.is_file() and f.suffix.lower() in ('.jpg', '.png', '.mp4')]
+    return sorted(str(f.relative_to(root)) for f in media)
+
+def run_pass(compile_module, root, entries, files, target_dir, youtube_url, jobs):
+    """One full compile; returns {stage: seconds}."""
+    c = compile_module
+    results = {}
+    data = copy.deepcopy(entries)
+
+    # Standalone dimension probing and thumbnailing with their own cache /
+    # output dir, so they are measured in isolation from process_entries
+    os.makedirs('bench_thumbs', exist_ok=True)
+    main_cache = c.media_cache
+    c.media_cache = c.MediaCache(os.path.join('entries', 'compiled', '.bench_cache.sqlite'))
+    try:
+        with c.MediaPool(jobs) as pool:
+            timed(results, 'dimensions', c.resolve_media_dimensions, files, pool)
+
+            def thumbnails():
+                futures = []
+                for f in files:
+                    if f.endswith('.mp4'):
+                        futures.append(pool.submit_subprocess(c.generate_video_thumbnail, f, 'bench_thumbs'))
+                    else:
+                        futures.append(pool.submit_image(c.generate_image_thumbnail, f, 'bench_thumbs'))
+                return [future.result() for future in futures]
+            timed(results, 'thumbnails', thumbnails)
+    finally:
+        c.media_cache = main_cache
+
+    c.validate_entries(data)
+    themes, _, _, file_lists = timed(results, 'process_entries', c.process_entries, data,
+                                     jobs=jobs, youtube_base_url=youtube_url)
+    check_youtube_thumbnails(data, root)
+
+    def html():
+        with open('output.html', 'w') as f:
+            c.write_html_content(themes, f)
+    timed(results, 'generate_html', html)
+    timed(results, 'recommendations', c.compute_recommendations, data, max_recommendations=4)
+    timed(results, 'json_output', c.write_compiled_json, data)
+    file_lists.append(timed(results, 'search_index', c.build_search_index, data))
+    plan = c.sync_plan(file_lists, root)
+    timed(results, 'copy', c.copy_to_git, file_lists, root, target_dir, jobs=jobs, plan=plan)
+    timed(results, 'precompress', c.precompress_tree, target_dir, jobs=jobs, published=plan)
+    results['total'] = round(sum(results.values()), 4)
+    return results
+
+# ---------------------------------------------------------------------------
+# Recommendation engines
+# ---------------------------------------------------------------------------
+def make_catalog(n_entries, topics=100, seed=1):
+    """Entries with just what the recommenders read. Each belongs to a topic
+    it draws most words and tags from, Zipf-weighted, so neighbours exist."""
+    rng = random.Random(seed)
+    pool = [a + b for a in WORDS for b in WORDS if a != b]
+    rng.shuffle(pool)
+    tags = [f'tag{i:03d}' for i in range(200)]
+    topic_words = [rng.sample(pool, 40) for _ in range(topics)]
+    topic_tags = [rng.sample(tags, 8) for _ in range(topics)]
+    zipf = [1 / (k + 1) for k in range(len(pool))]
+    entries = []
+    for i in range(n_entries):
+        topic = rng.randrange(topics)
+        words = (rng.choices(topic_words[topic], weights=zipf[:40], k=rng.randint(20, 60))
+                 + rng.choices(pool, weights=zipf, k=rng.randint(5, 20)))
+        entries.append({
+            'id': f'rec-{i:05d}',
+            'title': ' '.join(rng.sample(topic_words[topic], 3)),
+            'description': ' '.join(words),
+            'tags': ', '.join(rng.sample(topic_tags[topic], 2) + [rng.choice(tags)]),
+            'year': str(rng.randint(2000, 2025)),
+            'locked': rng.random() < 0.05,
+        })
+    return entries
+
+def time_engines(c, entries, python_rows, recall_target, max_recommendations=4):
+    """{engine: {'seconds', ...}} for one catalog."""
+    texts, tag_lists, years = c.recommendation_features(entries)
+    locked = [entry['locked'] for entry in entries]
+    text_vectorizer = c.TextVectorizer(max_features=300, min_df=1)
+    text_vectors = text_vectorizer.fit_transform(texts)
+    tag_vectorizer = c.TagVectorizer()
+    tag_vectors = tag_vectorizer.fit_transform(tag_lists)
+    args = (text_vectors, tag_vectors, years, locked, max_recommendations)
+    dims = (len(text_vectorizer.vocabulary), len(tag_vectorizer.vocabulary))
+    results = {}
+
+    start = time.perf_counter()
+    exact = c.recommend_numpy(*args, *dims)
+    results['numpy'] = {'seconds': round(time.perf_counter() - start, 3)}
+
+    start = time.perf_counter()
+    candidates, _ = c.tune_index_candidates(*args, *dims, recall_target=recall_target)
+    index = c.recommend_index(*args, *dims, candidates=candidates)
+    results['index'] = {'seconds': round(time.perf_counter() - start, 3), 'candidates': candidates,
+                        'recall': round(c.recommendation_recall(index, exact), 5)}
+
+    n = len(entries)
+    rows = list(range(n)) if n <= python_rows else sorted(set(
+        round(k * (n - 1) / (python_rows - 1)) for k in range(python_rows)))
+    start = time.perf_counter()
+    python = c.recommend_python(*args, rows=rows)
+    seconds = (time.perf_counter() - start) * n / len(rows)
+    results['python'] = {'seconds': round(seconds, 3), 'rows': len(rows),
+                         'matches_numpy': python == [exact[i] for i in rows]}
+    return results
+
+def report_engines(results):
+    print(f"\n{'entries':>8}  {'engine':<8}{'seconds':>10}{'speedup':>9}   notes")
+    for size, engines in results.items():
+        python_seconds = engines['python']['seconds']
+        for engine, r in engines.items():
+            notes = []
+            if r.get('rows', int(size)) < int(size):
+                notes.append(f"extrapolated from {r['rows']} rows")
+            if 'recall' in r:
+                notes.append(f"{r['candidates']} candidates, recall {r['recall']:.4f}")
+            if 'matches_numpy' in r:
+                notes.append('matches numpy' if r['matches_numpy'] else 'DIFFERS FROM NUMPY')
+            print(f"{size:>8}  {engine:<8}{r['seconds']:>9.2f}s{python_seconds / r['seconds']:>8.0f}x   "
+                  + ', '.join(notes))
+
+def bench_recommendations(args):
+    sys.path.insert(0, str(REPO_DIR))
+    c = importlib.import_module('compile')
+    importlib.import_module('scipy.sparse')   # NumPy/SciPy load outside the timings
+    results = {}
+    for size in (int(s) for s in args.sizes.split(',')):
+        print(f"Timing the engines on {size} entries ...")
+        results[str(size)] = time_engines(c, make_catalog(size), args.python_rows, args.recall_target)
+    report_engines(results)
+    return {'mode': 'recommend', 'sizes': args.sizes, 'python_rows': args.python_rows,
+            'recall_target': args.recall_target}, results
+
+# ---------------------------------------------------------------------------
+# Dimension probing
+# ---------------------------------------------------------------------------
+def fallback_dimensions(c, path):
+    """What a dimension lookup costs without the header parser: PIL (with
+    the EXIF orientation) for images, an ffprobe process for videos."""
+    if os.path.splitext(path)[1].lower() in c.VIDEO_DIMENSION_EXTENSIONS:
+        result = subprocess.run(c.FFPROBE_DIMENSIONS_CMD + [path], capture_output=True, text=True)
+        return c._parse_ffprobe_dimensions(result.stdout) if result.returncode == 0 else None
+    with Image.open(path) as img:
+        return c._oriented(img.size[0], img.size[1], img.getexif().get(c.EXIF_ORIENTATION_TAG))
+
+def bench_dimensions(args):
+    sys.path.insert(0, str(REPO_DIR))
+    c = importlib.import_module('compile')
+    extensions = c.IMAGE_DIMENSION_EXTENSIONS + c.VIDEO_DIMENSION_EXTENSIONS
+    files = sorted(str(f) for f in Path(args.media_dir).rglob('*')
+                   if f.is_file() and f.suffix.lower() in extensions)
+    scratch = Path(tempfile.mkdtemp(prefix='compile-bench-dims-'))
+    try:
+        # Formats the media folder may not have: a 60-frame GIF and a WebP
+        frames = [Image.effect_noise((640, 480), 40 + i).convert('P') for i in range(60)]
+        frames[0].save(scratch / 'animated.gif', save_all=True, append_images=frames[1:], duration=40)
+        Image.effect_noise((1280, 720), 40).convert('RGB').save(scratch / 'noise.webp', quality=80)
+        files += [str(scratch / 'animated.gif'), str(scratch / 'noise.webp')]
+
+        have_ffprobe = shutil.which('ffprobe') is not None
+        if not have_ffprobe:
+            print("  ffprobe not on PATH – videos are timed with the header parser only")
+        results = {}
+        for path in files:
+            kind = os.path.splitext(path)[1].lower().lstrip('.')
+            r = results.setdefault(kind, {'files': 0, 'header': 0.0, 'fallback': 0.0,
+                                          'unparsed': 0, 'mismatches': 0})
+            r['files'] += 1
+            start = time.perf_counter()
+            dims = c.read_header_dimensions(path)
+            r['header'] += time.perf_counter() - start
+            if dims is None:
+                r['unparsed'] += 1
+            if kind in ('webm', 'mp4', 'avi', 'mkv', 'mov') and not have_ffprobe:
+                r['fallback'] = None
+                continue
+            start = time.perf_counter()
+            expected = fallback_dimensions(c, path)
+            r['fallback'] += time.perf_counter() - start
+            if dims is not None and tuple(dims) != tuple(expected):
+                r['mismatches'] += 1
+                print(f"  ✗ {path}: header {dims}, fallback {expected}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"\n{'format':<8}{'files':>6}{'header':>12}{'fallback':>12}{'speedup':>9}   notes")
+    for kind, r in sorted(results.items()):
+        header_us = r['header'] / r['files'] * 1e6
+        r['header'] = round(header_us, 1)
+        line = f"{kind:<8}{r['files']:>6}{header_us:>10.1f}us"
+        if r['fallback'] is not None:
+            fallback_us = r['fallback'] / r['files'] * 1e6
+            r['fallback'] = round(fallback_us, 1)
+            line += f"{fallback_us:>10.1f}us{fallback_us / header_us:>8.0f}x"
+        else:
+            line += f"{'-':>12}{'-':>9}"
+        notes = []
+        if r['unparsed']:
+            notes.append(f"{r['unparsed']} left to the fallback")
+        if r['mismatches']:
+            notes.append(f"{r['mismatches']} MISMATCHES")
+        print(line + '   ' + ', '.join(notes))
+    return {'mode': 'dimensions', 'media_dir': os.path.abspath(args.media_dir)}, results
+
+# ---------------------------------------------------------------------------
+# History
+# ---------------------------------------------------------------------------
+def git_revision():
+    try:
+        out = subprocess.run(['git', '-C', str(REPO_DIR), 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', '-C', str(REPO_DIR), 'status', '--porcelain', 'compile.py'],
+                               capture_output=True, text=True).stdout.strip()
+        return out + ('+dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def previous_run(history_path, corpus):
+    try:
+        with open(history_path) as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    same = [run for run in runs if run['corpus'] == corpus]
+    return same[-1] if same else None
+
+def append_history(history_path, corpus, results):
+    with open(history_path, 'a') as f:
+        f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+                            'corpus': corpus, 'results': results}) + '\n')
+    print(f"\nAppended to {history_path}")
+
+def report(results, previous):
+    stages = list(results['cold'])
+    print(f"\n{'stage':<18}{'cold':>10}{'warm':>10}   vs previous run")
+    for stage in stages:
+        line = f"{stage:<18}{results['cold'][stage]:>9.3f}s{results['warm'][stage]:>9.3f}s"
+        notes = []
+        for phase in ('cold', 'warm'):
+            before = previous and previous['results'][phase].get(stage)
+            if before:
+                change = (results[phase][stage] - before) / before
+                flag = '  REGRESSION' if change > REGRESSION_THRESHOLD and results[phase][stage] - before > 0.01 else ''
+                notes.append(f"{phase} {change:+.0%}{flag}")
+        print(line + ('   ' + ', '.join(notes) if notes else ''))
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every compile.py stage on a synthetic portfolio.")
+    parser.add_argument('mode', nargs='?', choices=('stages', 'recommend', 'dimensions'), default='stages',
+                        help="stages (default): a full compile cold and warm; recommend: the "
+                             "recommendation engines alone; dimensions: header parser vs PIL/ffprobe")
+    parser.add_argument('--entries', type=int, default=40)
+    parser.add_argument('--images', type=int, default=3, help="images per entry")
+    parser.add_argument('--videos', type=int, default=1, help="testsrc videos per entry (needs ffmpeg)")
+    parser.add_argument('--youtube', type=int, default=4, help="entries whose first file is a .yt")
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--derivative-formats', default='',
+                        help="comma-separated formats of the responsive ladder, e.g. webp,avif (default none)")
+    parser.add_argument('--workdir', help="where to build the corpus (default: a temp dir, removed after)")
+    parser.add_argument('--history', default=str(HISTORY_PATH), help="JSON-lines file results are appended to")
+    parser.add_argument('--sizes', default='1000,10000,50000', help="catalog sizes for recommend")
+    parser.add_argument('--python-rows', type=int, default=300,
+                        help="rows the python engine scores for recommend before extrapolating")
+    parser.add_argument('--recall-target', type=float, default=0.95,
+                        help="recall the index engine is tuned to for recommend")
+    parser.add_argument('--media-dir', default=str(REPO_DIR / 'entries'),
+                        help="media folder dimensions reads (default the repository's entries/)")
+    args = parser.parse_args()
+    history_path = os.path.abspath(args.history)
+
+    if args.mode in ('recommend', 'dimensions'):
+        bench = bench_recommendations if args.mode == 'recommend' else bench_dimensions
+        corpus, results = bench(args)
+        append_history(history_path, corpus, results)
+        return
+
+    formats = [f.strip().lower() for f in args.derivative_formats.split(',') if f.strip()]
+    corpus = {'entries': args.entries, 'images': args.images, 'videos': args.videos,
+              'youtube': args.youtube, 'jobs': args.jobs, 'derivatives': formats}
+    root = Path(args.workdir or tempfile.mkdtemp(prefix='compile-bench-')).resolve()
+    cwd = os.getcwd()
+    print(f"Generating corpus in {root} ...")
+    entries = make_corpus(root, args.entries, args.images, args.videos, args.youtube)
+    files = media_files(root)
+    server, youtube_url = start_youtube_stub(root)
+    try:
+        # compile.py resolves every path against the working directory
+        os.chdir(root)
+        sys.path.insert(0, str(root))
+        compile_module = importlib.import_module('compile')
+        compile_module.ENCODER_SETTINGS['derivative_formats'] = formats
+        check_youtube_fetch(compile_module, root, youtube_url)
+        results = {}
+        for phase in ('cold', 'warm'):
+            print(f"\n--- {phase} pass ---")
+            results[phase] = run_pass(compile_module, root, entries, files, root / 'target',
+                                      youtube_url, args.jobs)
+    finally:
+        server.shutdown()
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    previous = previous_run(history_path, corpus)
+    report(results, previous)
+    append_history(history_path, corpus, results)
+
+if __name__ == '__main__':
+    main()
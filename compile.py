@@ -1,15 +1,16 @@
 import json
 import os
 import hashlib
-from collections import defaultdict
+from collections import defaultdict, deque
 import html
+import io
 import re
 import urllib.parse
 import subprocess
 import pathlib
-import PIL
-from PIL import Image, ExifTags
-import imageio
+import struct
+import queue
+import threading
 import math
 import time
 from collections import Counter
@@ -18,7 +19,10 @@ from collections import Counter
 # Media dimensions cache – avoids re-spawning ffprobe / re-opening images
 # when the underlying file hasn't changed.
 # ---------------------------------------------------------------------------
-CACHE_PATH = os.path.join('entries', 'compiled', '.media_cache.json')
+CACHE_PATH = os.path.join('entries', 'compiled', '.media_cache.sqlite')
+LEGACY_CACHE_PATH = os.path.join('entries', 'compiled', '.media_cache.json')
+# How long a failed download (e.g. a deleted YouTube video) is not retried
+FETCH_FAILURE_TTL = 24 * 60 * 60
 
 def _file_hash(filepath):
     """Fast hash: md5 of (file-size || first 8 KB of content)."""
@@ -32,106 +36,614 @@ def _file_hash(filepath):
         return None
 
 class MediaCache:
-    """Persistent cache mapping file paths to their dimensions."""
+    """Persistent cache mapping file paths to their dimensions.
 
-    def __init__(self):
-        self._data = {}   # path -> { "hash": str, "w": int, "h": int }
-        self._dirty = False
+    Stored in SQLite (WAL mode) so several worker processes can read and
+    write it at once. Lookups compare (size, mtime_ns, inode) first and only
+    hash the file when that stat data changed.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
         self.hits = 0
         self.misses = 0
-        self._load()
-
-    def _load(self):
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # sqlite handles must not cross a fork – reconnect in each process
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        import sqlite3
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute("""CREATE TABLE IF NOT EXISTS media (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER, mtime_ns INTEGER, inode INTEGER,
+                            hash TEXT NOT NULL, w INTEGER NOT NULL, h INTEGER NOT NULL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS digests (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER, mtime_ns INTEGER, inode INTEGER,
+                            digest TEXT NOT NULL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS web_copies (
+                            path TEXT PRIMARY KEY,
+                            source_digest TEXT NOT NULL)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS fetch_failures (
+                            key TEXT PRIMARY KEY,
+                            failed_at REAL NOT NULL, attempts INTEGER NOT NULL)""")
+        self._conn, self._pid = conn, os.getpid()
+        self._import_legacy()
+        return conn
+
+    def _import_legacy(self):
+        """One-time migration from the old .media_cache.json file. Rows come
+        in without stat data, so their first lookup re-validates by hash."""
+        if self._conn.execute('SELECT 1 FROM media LIMIT 1').fetchone():
+            return
         try:
-            with open(CACHE_PATH, 'r') as f:
-                self._data = json.load(f)
+            with open(LEGACY_CACHE_PATH, 'r') as f:
+                legacy = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            self._data = {}
+            return
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO media (path, hash, w, h) VALUES (?, ?, ?, ?)',
+            [(path, e['hash'], e['w'], e['h']) for path, e in legacy.items()])
 
     def save(self):
-        if not self._dirty:
-            return
-        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
-        with open(CACHE_PATH, 'w') as f:
-            json.dump(self._data, f)
+        """Writes are committed as they happen; this just drops entries whose
+        source files are gone. Returns the number of pruned rows."""
+        return self.prune()
+
+    def prune(self):
+        pruned = 0
+        with self._lock:
+            conn = self._connect()
+            for table in ('media', 'digests', 'web_copies'):
+                paths = [row[0] for row in conn.execute(f'SELECT path FROM {table}')]
+                gone = [(path,) for path in paths if not os.path.exists(path)]
+                if gone:
+                    conn.executemany(f'DELETE FROM {table} WHERE path = ?', gone)
+                    pruned += len(gone)
+            pruned += conn.execute('DELETE FROM fetch_failures WHERE failed_at < ?',
+                                   (time.time() - FETCH_FAILURE_TTL,)).rowcount
+        return pruned
+
+    def recent_failure(self, key, ttl=FETCH_FAILURE_TTL):
+        """True if fetching `key` failed less than `ttl` seconds ago."""
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT failed_at FROM fetch_failures WHERE key = ?', (key,)).fetchone()
+        return row is not None and time.time() - row[0] < ttl
+
+    def record_failure(self, key):
+        with self._lock:
+            self._connect().execute(
+                'INSERT INTO fetch_failures (key, failed_at, attempts) VALUES (?, ?, 1) '
+                'ON CONFLICT(key) DO UPDATE SET failed_at = excluded.failed_at, attempts = attempts + 1',
+                (key, time.time()))
+
+    def clear_failure(self, key):
+        with self._lock:
+            self._connect().execute('DELETE FROM fetch_failures WHERE key = ?', (key,))
+
+    def copy_source(self, copy_path):
+        """content_digest of the source a _c_ copy was made from, or None."""
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT source_digest FROM web_copies WHERE path = ?', (copy_path,)).fetchone()
+        return row[0] if row else None
+
+    def record_copy(self, copy_path, source_digest):
+        with self._lock:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO web_copies (path, source_digest) VALUES (?, ?)',
+                (copy_path, source_digest))
+
+    def content_digest(self, filepath):
+        """md5 of the whole file, recomputed only when its stat data changes."""
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        stat_key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ?', (filepath,)).fetchone()
+        if row and row[:3] == stat_key:
+            return row[3]
+        h = hashlib.md5()
+        try:
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        except OSError:
+            return None
+        with self._lock:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO digests (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)',
+                (filepath,) + stat_key + (h.hexdigest(),))
+        return h.hexdigest()
 
     def get(self, filepath):
         """Return cached (width, height) or None."""
-        fh = _file_hash(filepath)
-        if fh is None:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT size, mtime_ns, inode, hash, w, h FROM media WHERE path = ?',
+                               (filepath,)).fetchone()
+            if row:
+                if row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+                    self.hits += 1
+                    return (row[4], row[5])
+                # Stat changed (touch, copy, migration) – fall back to content
+                if _file_hash(filepath) == row[3]:
+                    conn.execute('UPDATE media SET size = ?, mtime_ns = ?, inode = ? WHERE path = ?',
+                                 (st.st_size, st.st_mtime_ns, st.st_ino, filepath))
+                    self.hits += 1
+                    return (row[4], row[5])
+            self.misses += 1
             return None
-        entry = self._data.get(filepath)
-        if entry and entry.get('hash') == fh:
-            self.hits += 1
-            return (entry['w'], entry['h'])
-        self.misses += 1
-        return None
 
     def put(self, filepath, width, height):
-        fh = _file_hash(filepath)
-        if fh is None:
+        self.put_many({filepath: (width, height)})
+
+    def put_many(self, dimensions):
+        """Store {path: (width, height)} results in a single transaction."""
+        rows = []
+        for filepath, (width, height) in dimensions.items():
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            fh = _file_hash(filepath)
+            if fh is None:
+                continue
+            rows.append((filepath, st.st_size, st.st_mtime_ns, st.st_ino, fh, width, height))
+        if not rows:
             return
-        self._data[filepath] = {'hash': fh, 'w': width, 'h': height}
-        self._dirty = True
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            conn.executemany(
+                'INSERT OR REPLACE INTO media (path, size, mtime_ns, inode, hash, w, h) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('COMMIT')
 
 media_cache = MediaCache()
 
-data = []
-json_files = [pos_json for pos_json in os.listdir('entries/')
-              if pos_json.endswith('.json') and pos_json != 'life-events.json']
+# ---------------------------------------------------------------------------
+# Tracing – spans around every build stage and every media call, written as
+# a Chrome trace (chrome://tracing, ui.perfetto.dev) with --trace. Spans
+# carry the file path and the entry id it belongs to. When tracing is off
+# span() hands back a shared no-op context, so the instrumentation costs
+# next to nothing. Work done in the process pool records its spans there
+# and MediaPool ships them back with the result.
+# ---------------------------------------------------------------------------
+import contextlib
+import functools
+
+TRACE_TOP_N = 15
+
+def path_entry_id(path):
+    """.../entries/<theme>/<id>/<file> -> id, else None."""
+    parts = pathlib.PurePath(path).parts
+    if 'entries' in parts:
+        i = parts.index('entries')
+        if len(parts) > i + 3 and parts[i + 1] != 'compiled':
+            return parts[i + 2]
+    return None
+
+class Tracer:
+    """Collects finished spans as Chrome trace 'complete' events."""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._noop = contextlib.nullcontext()
+
+    def span(self, name, cat='stage', tid=None, **args):
+        if not self.enabled:
+            return self._noop
+        return self._span(name, cat, tid, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, cat, tid, args):
+        start = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            self._add(name, cat, tid, args, start)
+
+    def record(self, name, start, cat='stage', **args):
+        """Span from start (time.monotonic_ns()) to now, for stretches of
+        code that aren't worth a with block."""
+        if self.enabled:
+            self._add(name, cat, None, args, start)
+
+    def _add(self, name, cat, tid, args, start):
+        path = args.get('path')
+        if path and 'entry' not in args:
+            entry_id = path_entry_id(path)
+            if entry_id:
+                args['entry'] = entry_id
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start // 1000,
+                 'dur': (time.monotonic_ns() - start) // 1000,
+                 'pid': os.getpid(), 'tid': tid or threading.get_native_id(), 'args': args}
+        with self._lock:
+            self.events.append(event)
+
+    def drain(self):
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def extend(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+    def write(self, path):
+        """Chrome trace JSON, timestamps relative to the first span."""
+        events = sorted(self.events, key=lambda e: e['ts'])
+        origin = events[0]['ts'] if events else 0
+        trace = [{**e, 'ts': e['ts'] - origin} for e in events]
+        trace += [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                   'args': {'name': 'compile.py' if pid == os.getpid() else 'media worker'}}
+                  for pid in sorted({e['pid'] for e in events})]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({'traceEvents': trace, 'displayTimeUnit': 'ms'}))
+        os.replace(tmp_path, path)
+
+    def summary(self, top_n=TRACE_TOP_N):
+        """Per-operation totals and the top_n slowest single calls (stages
+        are left out of the latter, they only repeat the totals)."""
+        totals = defaultdict(lambda: [0, 0, 0])   # name -> [count, total µs, max µs]
+        for e in self.events:
+            total = totals[e['name']]
+            total[0] += 1
+            total[1] += e['dur']
+            total[2] = max(total[2], e['dur'])
+        lines = [f"  {'operation':<28}{'count':>7}{'total':>11}{'max':>10}"]
+        for name, (count, total, longest) in sorted(totals.items(), key=lambda t: -t[1][1])[:top_n]:
+            lines.append(f"  {name:<28}{count:>7}{total / 1e6:>10.3f}s{longest / 1e6:>9.3f}s")
+        lines.append(f"\n  Slowest {top_n} spans:")
+        calls = [e for e in self.events if e['cat'] != 'stage']
+        for e in sorted(calls, key=lambda e: -e['dur'])[:top_n]:
+            where = e['args'].get('path') or e['args'].get('entry') or ''
+            lines.append(f"  {e['dur'] / 1e6:>9.3f}s  {e['name']:<28}{where}")
+        return '\n'.join(lines)
+
+tracer = Tracer()
+
+def span(name, cat='stage', tid=None, **args):
+    """with span('thumbnail', path=f): ... – timed when --trace is on. Spans
+    that overlap on one thread (asyncio tasks) need their own tid."""
+    return tracer.span(name, cat, tid, **args)
+
+def traced(name, cat='media'):
+    """Decorator: each call is a span named name, its first argument as path."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(name, cat, path=str(args[0]) if args else None):
+                return fn(*args, **kwargs)
+        return call
+    return decorate
+
+def run_traced(fn, *args):
+    """Pool-side wrapper: the result plus the spans recorded while making it."""
+    tracer.drain()
+    result = fn(*args)
+    return result, tracer.drain()
+
+def init_media_worker(settings, tracing):
+    """Workers see any command-line overrides of ENCODER_SETTINGS and the
+    tracing switch."""
+    ENCODER_SETTINGS.update(settings)
+    tracer.enabled = tracing
+    tracer.events = []
+
+# ---------------------------------------------------------------------------
+# Parallel media execution – PIL work goes to a process pool, ffmpeg/ffprobe
+# work to a bounded thread pool (those threads only wait on subprocesses).
+# With jobs=1 every task runs inline, so a serial build behaves as before.
+# ---------------------------------------------------------------------------
+class MediaPool:
+    """Dispatches media tasks to the right executor and hands back futures."""
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, jobs)
+        self._images = None
+        self._subprocesses = None
+        if self.jobs > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+            # Workers start on demand, while other threads of the build (the
+            # process_entries scanner, the subprocess pool) may hold a lock a
+            # forked child would inherit locked. A fork server forks them from
+            # a clean single-threaded process instead; it imports this module
+            # and PIL once, so workers don't each pay for the imports.
+            context = None
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(list(dict.fromkeys(['__main__', __name__, 'PIL.Image'])))
+            self._images = ProcessPoolExecutor(max_workers=self.jobs, mp_context=context,
+                                               initializer=init_media_worker,
+                                               initargs=(dict(ENCODER_SETTINGS), tracer.enabled))
+            self._subprocesses = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for executor in (self._images, self._subprocesses):
+            if executor:
+                executor.shutdown()
+
+    @staticmethod
+    def _run_inline(fn, *args):
+        from concurrent.futures import Future
+
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit_image(self, fn, *args):
+        """CPU-bound PIL work."""
+        if self._images is None:
+            return self._run_inline(fn, *args)
+        if not tracer.enabled:
+            return self._images.submit(fn, *args)
+        # Spans recorded in the worker travel back with the result
+        from concurrent.futures import Future
+
+        future = Future()
+
+        def unwrap(traced):
+            try:
+                result, events = traced.result()
+            except Exception as e:
+                future.set_exception(e)
+                return
+            tracer.extend(events)
+            future.set_result(result)
+        self._images.submit(run_traced, fn, *args).add_done_callback(unwrap)
+        return future
+
+    def submit_subprocess(self, fn, *args):
+        """Work that mostly waits on an ffmpeg / ffprobe child process."""
+        if self._subprocesses is None:
+            return self._run_inline(fn, *args)
+        return self._subprocesses.submit(fn, *args)
+
+    def submit(self, kind, fn, *args):
+        if kind == 'image':
+            return self.submit_image(fn, *args)
+        return self.submit_subprocess(fn, *args)
+
+# ---------------------------------------------------------------------------
+# Incremental build manifest – records each entry's input fingerprint (JSON
+# record, folder listing with stat data, encoder settings) together with its
+# media results, so untouched entries skip the media passes entirely.
+# ---------------------------------------------------------------------------
+MANIFEST_PATH = os.path.join('entries', 'compiled', '.build_manifest.json')
+
+# Everything that changes what the media passes produce for the same inputs.
+# Bump 'version' whenever the pipeline itself changes its output.
+ENCODER_SETTINGS = {
+    'version': 3,
+    'max_filesize': 1000000,
+    'image_quality': 85,
+    'thumb_size': 400,
+    'thumb_quality': 80,
+    'video_thumb_size': 500,
+    # Seconds into a video its poster frame is taken from; an entry's own
+    # poster_time field overrides it
+    'video_poster_time': 0,
+    # Responsive ladder written next to each web image (never upscaled).
+    # Off by default: encoding it multiplies a cold build several times over
+    # (AVIF most of all); enable with --derivative-formats webp,avif
+    'derivative_widths': [480, 960, 1600],
+    'derivative_formats': [],
+    # Pillow save() options per format; AVIF speed 8 is ~4x faster than the
+    # default 6 at the same size for these photos
+    'derivative_encoders': {'webp': {'quality': 80}, 'avif': {'quality': 60, 'speed': 8}},
+}
+
+# Fields process_entries / compute_recommendations write into each record
+COMPUTED_FIELDS = ('thumbnail_override', 'media_dimensions', 'file_paths', 'recommended_ids')
+
+def entry_folder(entry, entries_dir='entries'):
+    """entries/<first theme>/<id>, where an entry's media lives."""
+    return os.path.join(entries_dir, entry['theme'].split(',')[0].strip(), entry['id'])
+
+def entry_fingerprint(entry, folder_path):
+    """Hash of an entry's JSON record, its folder listing and the encoder settings."""
+    record = {k: v for k, v in entry.items() if k not in COMPUTED_FIELDS}
+    listing = []
+    try:
+        with os.scandir(folder_path) as it:
+            for dir_entry in it:
+                if dir_entry.is_file():
+                    st = dir_entry.stat()
+                    listing.append((dir_entry.name, st.st_size, st.st_mtime_ns))
+    except FileNotFoundError:
+        pass
+    listing.sort()
+    payload = json.dumps([record, listing, ENCODER_SETTINGS], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class BuildManifest:
+    """Persistent map of entry id -> fingerprint and media results."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._previous = {}
+        self._current = {}
+        self.reused = 0
+        self.rebuilt = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self._previous = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._previous = {}
+
+    def lookup(self, entry_id, fingerprint, thumbs_base_dir):
+        """Return the stored results if the fingerprint matches and the
+        thumbnail they reference is still on disk, else None."""
+        record = self._previous.get(entry_id)
+        if not record or record.get('fingerprint') != fingerprint:
+            return None
+        thumb = record.get('thumbnail_override')
+        if thumb and not os.path.exists(os.path.join(thumbs_base_dir, os.path.basename(thumb))):
+            return None
+        # Entries whose .yt thumbnail is missing are never recorded; heal
+        # manifests written while that was not the case
+        file_paths = record.get('file_paths') or []
+        if not thumb and file_paths and file_paths[0].endswith('.yt'):
+            return None
+        self._current[entry_id] = record
+        self.reused += 1
+        return record
+
+    def record(self, entry_id, fingerprint, entry):
+        self._current[entry_id] = {
+            'fingerprint': fingerprint,
+            'file_paths': entry['file_paths'],
+            'media_dimensions': entry['media_dimensions'],
+            'thumbnail_override': entry['thumbnail_override'],
+        }
+        self.rebuilt += 1
+
+    def is_current(self, entry_id, fingerprint):
+        record = self._previous.get(entry_id)
+        return bool(record) and record.get('fingerprint') == fingerprint
+
+    def save(self, keep_unseen=False):
+        """Write only the entries seen in this build (drops removed ids), or
+        with keep_unseen, merge them over the previous records."""
+        if keep_unseen:
+            self._current = {**self._previous, **self._current}
+        if self._current == self._previous:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._current, f)
+        os.replace(tmp_path, self.path)
+
+def load_entries(entries_dir='entries'):
+    """Every entry of every entries/*.json file (life-events.json excluded)."""
+    data = []
+    json_files = [pos_json for pos_json in os.listdir(entries_dir)
+                  if pos_json.endswith('.json') and pos_json != 'life-events.json']
+
+    # For each file, open it, load the JSON data, and add it to the list
+    for file_name in json_files:
+        with open(os.path.join(entries_dir, file_name), 'r') as file:
+            file_data = json.load(file)
+            data.extend(file_data)
+    return data
+
+VIDEO_EXTENSIONS = [".mp4", ".avi", ".mkv", ".mov"]
+COMPRESSIBLE_IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"]
+
+def clean_filename(filename):
+    """Rename a file to its sanitized name and return the new path.
+
+    Returns None for files that should be dropped from the listing.
+    """
+    if 'DS_Store' in filename or filename.endswith('.psd'):
+        return None
+
+    # Get the base filename and directory
+    base_name = os.path.basename(filename)
+    dir_name = os.path.dirname(filename)
+
+    # Clean filename
+    name_without_ext, extension = os.path.splitext(base_name)
+    extension = extension.lower()
+    sanitized_base_name = re.sub(r'[^\w-]+', '_', name_without_ext)
+    cleaned_base_name = re.sub(r'_{2,}', '_', sanitized_base_name)
+    cleaned_full_name = cleaned_base_name + extension
+
+    # Handle file renaming if needed
+    if base_name != cleaned_full_name:
+        new_filename = os.path.join(dir_name, cleaned_full_name)
+        print(f"Renaming: '{base_name}' → '{cleaned_full_name}' in '{dir_name}'")
+        os.rename(filename, new_filename)
+        filename = new_filename
+
+    return filename
+
+def media_job_kind(filename):
+    """Which pool a file's compression work belongs to: 'subprocess', 'image' or None."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in VIDEO_EXTENSIONS or extension == ".gif":
+        return 'subprocess'
+    if extension in COMPRESSIBLE_IMAGE_EXTENSIONS:
+        return 'image'
+    return None
+
+@traced('process_media')
+def process_media_file(filename):
+    """Compress/convert a single (already cleaned) file and return the path to use."""
+    extension = os.path.splitext(filename)[1].lower()
+
+    # Handle video conversion (always convert to WebM)
+    if extension in VIDEO_EXTENSIONS:
+        filename = compress_video_if_needed(filename, ENCODER_SETTINGS['max_filesize'])
+    # Handle animated GIF conversion to WebM
+    elif extension == ".gif":
+        from PIL import Image
+
+        try:
+            with Image.open(filename) as img:
+                if getattr(img, 'n_frames', 1) > 1:
+                    filename = compress_video_if_needed(filename, ENCODER_SETTINGS['max_filesize'])
+        except Exception:
+            pass  # Leave static GIFs as-is
+    # Handle image compression
+    elif extension in COMPRESSIBLE_IMAGE_EXTENSIONS:
+        filename = compress_image_if_needed(filename, ENCODER_SETTINGS['max_filesize'])
 
-# For each file, open it, load the JSON data, and add it to the list
-for file_name in json_files:
-    with open('entries/' + file_name, 'r') as file:
-        file_data = json.load(file)
-        data.extend(file_data)
+    return filename
 
 def process_files(file_list):
     """Updated process_files function with WebM-only video handling"""
     updated_file_list = []
-    
+
     for filename in file_list:
-        if 'DS_Store' in filename or filename.endswith('.psd'):
+        filename = clean_filename(filename)
+        if filename is None:
             continue
-            
-        # Get the base filename and directory
-        base_name = os.path.basename(filename)
-        dir_name = os.path.dirname(filename)
-        
-        # Clean filename
-        name_without_ext, extension = os.path.splitext(base_name)
-        extension = extension.lower()
-        sanitized_base_name = re.sub(r'[^\w-]+', '_', name_without_ext)
-        cleaned_base_name = re.sub(r'_{2,}', '_', sanitized_base_name)
-        cleaned_full_name = cleaned_base_name + extension
-        
-        # Handle file renaming if needed
-        if base_name != cleaned_full_name:
-            new_filename = os.path.join(dir_name, cleaned_full_name)
-            print(f"Renaming: '{base_name}' → '{cleaned_full_name}' in '{dir_name}'")
-            os.rename(filename, new_filename)
-            filename = new_filename
-        
-        # Handle video conversion (always convert to WebM)
-        if extension in [".mp4", ".avi", ".mkv", ".mov"]:
-            filename = compress_video_if_needed(filename, 1000000)
-        # Handle animated GIF conversion to WebM
-        elif extension == ".gif":
-            try:
-                with Image.open(filename) as img:
-                    if getattr(img, 'n_frames', 1) > 1:
-                        filename = compress_video_if_needed(filename, 1000000)
-            except Exception:
-                pass  # Leave static GIFs as-is
-        # Handle image compression
-        elif extension in [".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"]:
-            filename = compress_image_if_needed(filename, 1000000)
-            
-        updated_file_list.append(filename)
-    
+        updated_file_list.append(process_media_file(filename))
+
     # Filter out original videos if WebM versions exist
     filtered_file_list = filter_video_files(updated_file_list)
-    
+
     return filtered_file_list
 
 
@@ -166,11 +678,94 @@ def calculate_max_height(file_list):
     return round(max(constrained_heights)) if constrained_heights else 0
 
 # Add this function alongside your other image/video processing functions
-def generate_image_thumbnail(image_path, thumbs_base_dir, size=(400, 400)):
+# ---------------------------------------------------------------------------
+# Thumbnail naming and garbage collection – thumbnails are named after the
+# source's content plus the settings that shaped them, so an edited source
+# gets a fresh thumbnail, and anything no entry references can be deleted.
+# Derivative rungs next to the media are collected the same way, per entry.
+# ---------------------------------------------------------------------------
+THUMB_NAME_PATTERN = re.compile(r'^[0-9a-f]{32}(_thumb)?\.(jpg|webm)$')
+# _c_ copies keep their source's jpg/png/webm extension, so only rungs match
+DERIVATIVE_NAME_PATTERN = re.compile(r'^_c_.+_w\d+\.(webp|avif)$')
+
+def thumbnail_key(source_path, settings):
+    """Content-addressed thumbnail name for a source file and its thumbnail settings."""
+    digest = media_cache.content_digest(source_path) or source_path
+    payload = json.dumps([digest, settings], sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+def referenced_thumbnails(entries):
+    """Filenames under the thumbs dir that the given entries point at,
+    including the poster frame that goes with every video thumbnail."""
+    referenced = set()
+    for entry in entries:
+        paths = [entry.get('thumbnail_override') or '']
+        paths += list(entry.get('media_dimensions', {}))
+        for path in paths:
+            if not path.startswith('static/thumbs/'):
+                continue
+            name = os.path.basename(path)
+            referenced.add(name)
+            if name.endswith('_thumb.webm'):
+                referenced.add(name[:-len('.webm')] + '.jpg')
+    return referenced
+
+def collect_thumbnail_garbage(thumbs_base_dir, referenced):
+    """Delete generated thumbnails and posters no entry references any more.
+    Only files following the generated naming scheme are touched."""
+    removed, freed = 0, 0
+    for name in os.listdir(thumbs_base_dir):
+        if name in referenced or not THUMB_NAME_PATTERN.match(name):
+            continue
+        path = os.path.join(thumbs_base_dir, name)
+        freed += os.path.getsize(path)
+        os.remove(path)
+        removed += 1
+    return removed, freed
+
+def collect_derivative_garbage(entry, folder_path):
+    """Delete the derivative rungs in an entry's folder that its media no
+    longer lists, i.e. those of changed or removed sources."""
+    referenced = {os.path.basename(variant['path']) for dims in entry['media_dimensions'].values()
+                  for variant in dims.get('variants', [])}
+    removed, freed = 0, 0
+    try:
+        names = os.listdir(folder_path)
+    except FileNotFoundError:
+        return removed, freed
+    for name in names:
+        if name in referenced or not DERIVATIVE_NAME_PATTERN.match(name):
+            continue
+        path = os.path.join(folder_path, name)
+        freed += os.path.getsize(path)
+        os.remove(path)
+        removed += 1
+    return removed, freed
+
+def image_thumbnail_paths(image_path, thumbs_base_dir,
+                          size=(ENCODER_SETTINGS['thumb_size'], ENCODER_SETTINGS['thumb_size'])):
+    """(path as referenced from compiled.json, path on disk) of an image's thumbnail."""
+    hash_name = thumbnail_key(image_path, {
+        'kind': 'image', 'size': list(size), 'quality': ENCODER_SETTINGS['thumb_quality']})
+    thumb_filename = f"{hash_name}.jpg"
+    return f"static/thumbs/{thumb_filename}", os.path.join(thumbs_base_dir, thumb_filename)
+
+def save_thumbnail(img, thumb_full_path, size):
+    """Shrink an RGB image in place and write it as the thumbnail JPEG."""
+    from PIL import Image
+
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    img.save(thumb_full_path, "JPEG", quality=ENCODER_SETTINGS['thumb_quality'], optimize=True)
+
+@traced('image_thumbnail')
+def generate_image_thumbnail(image_path, thumbs_base_dir,
+                             size=(ENCODER_SETTINGS['thumb_size'], ENCODER_SETTINGS['thumb_size'])):
     """
     Creates a small, compressed thumbnail for a given image.
     Animated GIFs are converted to WebM video thumbnails via ffmpeg.
     """
+    from PIL import Image
+
     # Check if this is an animated GIF — route through video thumbnail pipeline
     if image_path.lower().endswith('.gif'):
         try:
@@ -181,34 +776,17 @@ def generate_image_thumbnail(image_path, thumbs_base_dir, size=(400, 400)):
             pass  # Fall through to static thumbnail
 
     try:
-        # Create a unique, stable filename using a hash
-        hash_obj = hashlib.md5(image_path.encode())
-        hash_name = hash_obj.hexdigest()
-        thumb_filename = f"{hash_name}.jpg"
-
-        # Define paths
-        thumb_rel_path = f"static/thumbs/{thumb_filename}"
-        thumb_full_path = os.path.join(thumbs_base_dir, thumb_filename)
+        thumb_rel_path, thumb_full_path = image_thumbnail_paths(image_path, thumbs_base_dir, size)
 
         # If thumbnail doesn't already exist, create it
         if not os.path.exists(thumb_full_path):
             with Image.open(image_path) as img:
                 # Handle EXIF orientation just in case
-                try:
-                    for orientation in ExifTags.TAGS.keys():
-                        if ExifTags.TAGS[orientation] == 'Orientation':
-                            break
-                    exif = img._getexif()
-                    if exif and exif.get(orientation) in [3, 6, 8]:
-                        if exif[orientation] == 3: img = img.rotate(180, expand=True)
-                        elif exif[orientation] == 6: img = img.rotate(270, expand=True)
-                        elif exif[orientation] == 8: img = img.rotate(90, expand=True)
-                except (AttributeError, KeyError, IndexError):
-                    pass # No EXIF data
-
-                img = img.convert('RGB')
-                img.thumbnail(size, PIL.Image.Resampling.LANCZOS)
-                img.save(thumb_full_path, "JPEG", quality=80, optimize=True)
+                orientation = image_orientation(img)
+                # Reduced-size JPEG decode: only what the thumbnail needs
+                img.draft('RGB', (size[0] * 2, size[1] * 2))
+                img = apply_orientation(img, orientation)
+                save_thumbnail(img.convert('RGB'), thumb_full_path, size)
                 print(f"  ✓ Generated thumbnail for {os.path.basename(image_path)}")
 
         return thumb_rel_path
@@ -216,65 +794,116 @@ def generate_image_thumbnail(image_path, thumbs_base_dir, size=(400, 400)):
         print(f"  ✗ Failed to create thumbnail for {image_path}: {e}")
         return None
 
-def generate_video_thumbnail(video_path, thumbs_base_dir, max_size=500):
+# VP9 settings for the silent looping video thumbnails
+VIDEO_THUMB_CODEC_ARGS = [
+    "-an",                          # Remove audio
+    "-c:v", "libvpx-vp9",          # VP9 codec
+    "-b:v", "0",                   # Use CRF-only mode
+    "-crf", "28",                  # Lower CRF = better quality (20–32 range)
+    "-cpu-used", "4",              # Good speed-quality balance (0=best quality, 5=fastest)
+    "-deadline", "good",           # Better visual quality than "realtime"
+    "-auto-alt-ref", "1",          # Allow alternate reference frames (improves quality)
+    "-lag-in-frames", "25",        # Enable lookahead for better compression
+]
+POSTER_CODEC_ARGS = ["-frames:v", "1", "-q:v", "5"]
+
+def video_thumbnail_command(video_path, scale, thumb_path=None, poster_path=None, poster_time=0):
+    """
+    One ffmpeg invocation producing whichever of the WebM thumbnail and the
+    JPEG poster are requested. When both come from the start of the video the
+    decoded stream is split in the filter graph, so the source is decoded
+    once; a poster taken later in the video gets its own input with
+    input-side seeking (-ss before -i), which jumps to the nearest keyframe
+    instead of decoding everything before it.
+    """
+    cmd = ["ffmpeg", "-y"]
+    filters = []
+    outputs = []
+    if thumb_path:
+        cmd += ["-i", video_path]
+        if poster_path and not poster_time:
+            filters.append(f"[0:v]scale={scale},split=2[thumb][poster]")
+        else:
+            filters.append(f"[0:v]scale={scale}[thumb]")
+        outputs += ["-map", "[thumb]"] + VIDEO_THUMB_CODEC_ARGS + [thumb_path]
+    if poster_path:
+        if not thumb_path or poster_time:
+            cmd += ["-ss", str(poster_time), "-i", video_path]
+            poster_input = 1 if thumb_path else 0
+            filters.append(f"[{poster_input}:v]scale={scale}[poster]")
+        outputs += ["-map", "[poster]"] + POSTER_CODEC_ARGS + [poster_path]
+    return cmd + ["-filter_complex", ";".join(filters)] + outputs
+
+@traced('video_thumbnail')
+def generate_video_thumbnail(video_path, thumbs_base_dir, max_size=ENCODER_SETTINGS['video_thumb_size'],
+                             poster_time=ENCODER_SETTINGS['video_poster_time']):
     """
-    Creates a small, compressed video thumbnail with no audio.
-    Max resolution of 300px on the longest edge.
+    Creates a small, compressed video thumbnail with no audio, plus a static
+    poster frame for OG images, in a single ffmpeg run.
+    Max resolution of max_size px on the longest edge. The poster is taken
+    poster_time seconds in, or from the first frame if the video is shorter.
     """
     try:
-        # Create unique filename using hash
-        hash_obj = hashlib.md5(video_path.encode())
-        hash_name = hash_obj.hexdigest()
+        # Named after the source content and everything that shapes the output
+        hash_name = thumbnail_key(video_path, {
+            'kind': 'video', 'max_size': max_size, 'poster_time': poster_time,
+            'codec': VIDEO_THUMB_CODEC_ARGS, 'poster': POSTER_CODEC_ARGS})
         thumb_filename = f"{hash_name}_thumb.webm"
+        poster_filename = f"{hash_name}_thumb.jpg"
         
         # Define paths
         thumb_rel_path = f"static/thumbs/{thumb_filename}"
         thumb_full_path = os.path.join(thumbs_base_dir, thumb_filename)
+        poster_full_path = os.path.join(thumbs_base_dir, poster_filename)
 
-        # Get video dimensions to calculate scale
-        width, height = get_video_dimensions(video_path)
+        make_thumb = not os.path.exists(thumb_full_path)
+        make_poster = not os.path.exists(poster_full_path)
+        if not make_thumb and not make_poster:
+            return thumb_rel_path
 
-        # Calculate scale to fit within max_size
-        if width > height:
-            scale = f"{max_size}:-2"  # Scale width to max_size, height auto
+        # Video dimensions (from the media cache) decide which edge to fit
+        dims = calculate_media_dimensions(video_path)
+        if dims:
+            width, height = dims
+            # Calculate scale to fit within max_size
+            if width > height:
+                scale = f"{max_size}:-2"  # Scale width to max_size, height auto
+            else:
+                scale = f"-2:{max_size}"  # Scale height to max_size, width auto
         else:
-            scale = f"-2:{max_size}"  # Scale height to max_size, width auto
+            # Let ffmpeg pick the long edge itself
+            scale = f"'if(gt(iw,ih),{max_size},-2)':'if(gt(iw,ih),-2,{max_size})'"
 
-        # Generate video thumbnail if it doesn't exist
-        if not os.path.exists(thumb_full_path):
+        if make_thumb:
             print(f"  Creating video thumbnail for {os.path.basename(video_path)}...")
-            subprocess.run([
-                "ffmpeg", "-i", video_path,
-                "-an",                          # Remove audio
-                "-vf", f"scale={scale}",        # Scale to max 300px
-                "-c:v", "libvpx-vp9",          # VP9 codec
-                "-b:v", "0",                   # Use CRF-only mode
-                "-crf", "28",                  # Lower CRF = better quality (20–32 range)
-                "-cpu-used", "4",              # Good speed-quality balance (0=best quality, 5=fastest)
-                "-deadline", "good",           # Better visual quality than "realtime"
-                "-auto-alt-ref", "1",          # Allow alternate reference frames (improves quality)
-                "-lag-in-frames", "25",        # Enable lookahead for better compression
-                "-y",                          # Overwrite
-                thumb_full_path
-            ], check=True, capture_output=True)
-            print(f"  ✓ Generated video thumbnail: {thumb_rel_path}")
-
-        # Generate a static poster frame for OG images
-        poster_filename = f"{hash_name}_thumb.jpg"
-        poster_full_path = os.path.join(thumbs_base_dir, poster_filename)
-        if not os.path.exists(poster_full_path):
+        try:
             try:
-                subprocess.run([
-                    "ffmpeg", "-i", video_path,
-                    "-vframes", "1",
-                    "-vf", f"scale={scale}",
-                    "-q:v", "5",
-                    "-y",
-                    poster_full_path
-                ], check=True, capture_output=True)
-                print(f"  ✓ Generated poster frame: static/thumbs/{poster_filename}")
-            except Exception as e:
-                print(f"  ✗ Failed to create poster frame: {e}")
+                subprocess.run(video_thumbnail_command(
+                    video_path, scale,
+                    thumb_path=thumb_full_path if make_thumb else None,
+                    poster_path=poster_full_path if make_poster else None,
+                    poster_time=poster_time,
+                ), check=True, capture_output=True)
+            except subprocess.CalledProcessError:
+                if not (make_poster and poster_time):
+                    raise
+                # Seeking past the end leaves the poster without a frame
+                print(f"  ✗ No frame at {poster_time}s, taking the poster from the start")
+                subprocess.run(video_thumbnail_command(
+                    video_path, scale,
+                    thumb_path=thumb_full_path if make_thumb else None,
+                    poster_path=poster_full_path,
+                ), check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            if make_thumb:
+                raise
+            # A missing poster alone doesn't invalidate the existing thumbnail
+            print(f"  ✗ Failed to create poster frame: {e}")
+            return thumb_rel_path
+        if make_thumb:
+            print(f"  ✓ Generated video thumbnail: {thumb_rel_path}")
+        if make_poster:
+            print(f"  ✓ Generated poster frame: static/thumbs/{poster_filename}")
 
         return thumb_rel_path
 
@@ -286,7 +915,6 @@ def generate_video_thumbnail(video_path, thumbs_base_dir, max_size=500):
         print(f"  ✗ Error creating video thumbnail for {video_path}: {e}")
         return None
     
-import requests
 from pathlib import Path
 
 def extract_youtube_id(yt_file_path):
@@ -313,73 +941,174 @@ def extract_youtube_id(yt_file_path):
         print(f"Error reading .yt file {yt_file_path}: {e}")
         return None
 
-def download_youtube_thumbnail(video_id, output_path):
-    """Download YouTube thumbnail for given video ID"""
+# ---------------------------------------------------------------------------
+# YouTube thumbnails – every needed video id is fetched in one concurrent
+# stage over a pooled session. Failures are remembered in the media cache for
+# FETCH_FAILURE_TTL so a dead video doesn't cost a timeout on every build.
+# ---------------------------------------------------------------------------
+YOUTUBE_THUMB_BASE_URL = "https://img.youtube.com/vi"
+# In order of preference
+YOUTUBE_THUMB_QUALITIES = [
+    "maxresdefault",   # 1280x720
+    "hqdefault",       # 480x360
+    "mqdefault",       # 320x180
+]
+YOUTUBE_FETCH_CONCURRENCY = 8
+YOUTUBE_FETCH_TIMEOUT = 10
+
+def youtube_session(concurrency=YOUTUBE_FETCH_CONCURRENCY):
+    """A requests session whose connection pool fits `concurrency` workers."""
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+@traced('youtube_download')
+def download_youtube_thumbnail(video_id, output_path, session=None,
+                               base_url=YOUTUBE_THUMB_BASE_URL, timeout=YOUTUBE_FETCH_TIMEOUT):
+    """Download YouTube thumbnail for given video ID.
+
+    Returns True once saved, False when YouTube definitively has none (404s
+    or its placeholder image) and None when a request failed without an
+    answer (connection error, timeout, server error), so nothing is known.
+    """
+    import requests
+
     # Try different quality thumbnails in order of preference
-    thumbnail_urls = [
-        f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",  # 1280x720
-        f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",      # 480x360
-        f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg",      # 320x180
-    ]
-    
+    thumbnail_urls = [f"{base_url}/{video_id}/{quality}.jpg" for quality in YOUTUBE_THUMB_QUALITIES]
+    get = session.get if session is not None else requests.get
+    unanswered = False
+
     for url in thumbnail_urls:
         try:
-            response = requests.get(url, timeout=10)
+            response = get(url, timeout=timeout)
             if response.status_code == 200:
                 # Check if it's not the default "not found" image
                 if len(response.content) > 1000:  # YouTube's 404 image is tiny
-                    with open(output_path, 'wb') as f:
+                    # Write beside the target first so a killed build never leaves half a JPEG
+                    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'wb') as f:
                         f.write(response.content)
+                    os.replace(tmp_path, output_path)
                     return True
+            elif response.status_code != 404:
+                unanswered = True
         except Exception as e:
             print(f"Error downloading thumbnail from {url}: {e}")
+            unanswered = True
             continue
-    
-    return False
 
-def process_youtube_thumbnails(entry, folder_path, thumbs_base_dir):
-    """Process YouTube thumbnails for an entry - only if .yt is the thumbnail"""
+    return None if unanswered else False
+
+def youtube_thumbnail_paths(video_id, thumbs_base_dir):
+    """(path stored in compiled.json, path on disk) for a video's thumbnail."""
+    # Generate hash for filename
+    thumb_filename = f"{hashlib.md5(video_id.encode()).hexdigest()}.jpg"
+    #public is served as static by node
+    return f"static/thumbs/{thumb_filename}", os.path.join(thumbs_base_dir, thumb_filename)
+
+def youtube_video_id(entry, folder_path):
+    """Video id of the entry's .yt file, only if .yt is the thumbnail"""
     file_paths = entry.get('file_paths', [])
-    
+
     # Only process if the FIRST file is a .yt file (would be used as thumbnail)
     if not file_paths or not file_paths[0].endswith('.yt'):
         return None
-    
+
     # Extract YouTube ID from the first file
-    yt_file_path = file_paths[0]
-    full_path = os.path.join(folder_path, os.path.basename(yt_file_path))
-    video_id = extract_youtube_id(full_path)
-    
+    full_path = os.path.join(folder_path, os.path.basename(file_paths[0]))
+    return extract_youtube_id(full_path) or None
+
+def fetch_youtube_thumbnails(video_ids, thumbs_base_dir, offline=False,
+                             base_url=YOUTUBE_THUMB_BASE_URL,
+                             concurrency=YOUTUBE_FETCH_CONCURRENCY,
+                             failure_ttl=FETCH_FAILURE_TTL, cache=None):
+    """
+    Make sure a thumbnail exists for every video id. Returns {video_id:
+    thumbnail path or None}.
+
+    Missing thumbnails are downloaded concurrently, skipping ids YouTube
+    had no thumbnail for within failure_ttl. Network errors are not
+    remembered, so the next build retries them. With offline=True nothing
+    touches the network and only thumbnails already on disk are returned.
+    """
+    cache = cache or media_cache
+    results = {}
+    missing = {}
+    for video_id in dict.fromkeys(video_ids):
+        thumb_rel_path, thumb_full_path = youtube_thumbnail_paths(video_id, thumbs_base_dir)
+        if os.path.exists(thumb_full_path):
+            # Thumbnail already exists, just return the path
+            results[video_id] = thumb_rel_path
+        elif offline:
+            print(f"  - Offline: no thumbnail for YouTube {video_id}")
+            results[video_id] = None
+        elif cache.recent_failure(f"youtube:{video_id}", failure_ttl):
+            print(f"  - Skipping YouTube {video_id}: download failed recently")
+            results[video_id] = None
+        else:
+            missing[video_id] = (thumb_rel_path, thumb_full_path)
+    if not missing:
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    os.makedirs(thumbs_base_dir, exist_ok=True)
+    print(f"Downloading {len(missing)} YouTube thumbnails...")
+    with youtube_session(concurrency) as session, \
+            ThreadPoolExecutor(max_workers=min(concurrency, len(missing))) as executor:
+        futures = {video_id: executor.submit(download_youtube_thumbnail, video_id, full_path,
+                                             session, base_url)
+                   for video_id, (_, full_path) in missing.items()}
+        for video_id, future in futures.items():
+            thumb_rel_path = missing[video_id][0]
+            downloaded = future.result()
+            if downloaded:
+                cache.clear_failure(f"youtube:{video_id}")
+                print(f"  ✓ Saved {video_id} to {thumb_rel_path}")
+                results[video_id] = thumb_rel_path
+            elif downloaded is None:
+                print(f"  ✗ Could not fetch thumbnail for {video_id}, retrying next build")
+                results[video_id] = None
+            else:
+                cache.record_failure(f"youtube:{video_id}")
+                print(f"  ✗ Failed to download thumbnail for {video_id}")
+                results[video_id] = None
+    return results
+
+def process_youtube_thumbnails(entry, folder_path, thumbs_base_dir, offline=False):
+    """Process YouTube thumbnails for an entry - only if .yt is the thumbnail"""
+    video_id = youtube_video_id(entry, folder_path)
     if not video_id:
         return None
-    
-    # Generate hash for filename
-    hash_obj = hashlib.md5(video_id.encode())
-    hash_name = hash_obj.hexdigest()
-    
-    # Create thumbnail path
-    thumb_filename = f"{hash_name}.jpg"
-    #public is served as static by node
-    thumb_rel_path = f"static/thumbs/{thumb_filename}"
-    thumb_full_path = os.path.join(thumbs_base_dir, thumb_filename)
-    
-    # Ensure thumbs directory exists
-    os.makedirs(os.path.dirname(thumb_full_path), exist_ok=True)
-    
-    # Check if thumbnail already exists
-    if not os.path.exists(thumb_full_path):
-        print(f"Downloading thumbnail for {entry['title']} (YouTube: {video_id})...")
-        if download_youtube_thumbnail(video_id, thumb_full_path):
-            print(f"  ✓ Saved to {thumb_rel_path}")
-            return thumb_rel_path
-        else:
-            print(f"  ✗ Failed to download thumbnail")
-    else:
-        # Thumbnail already exists, just return the path
-        return thumb_rel_path
-    
+    return fetch_youtube_thumbnails([video_id], thumbs_base_dir, offline=offline)[video_id]
+
+IMAGE_DIMENSION_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"]
+VIDEO_DIMENSION_EXTENSIONS = [".webm", ".mp4", ".avi", ".mkv", ".mov"]
+
+def dimension_job_kind(file_path):
+    """Which pool probing this file belongs to: 'image', 'subprocess' or None."""
+    extension = pathlib.Path(file_path).suffix.lower()
+    if extension in IMAGE_DIMENSION_EXTENSIONS:
+        return 'image'
+    if extension in VIDEO_DIMENSION_EXTENSIONS:
+        return 'subprocess'
     return None
 
+@traced('probe_dimensions')
+def probe_media_dimensions(file_path):
+    """Uncached dimension lookup; safe to run in a worker."""
+    try:
+        if dimension_job_kind(file_path) == 'image':
+            return get_image_dimensions(file_path)
+        return get_video_dimensions(file_path)
+    except Exception as e:
+        print(f"Error getting dimensions for {file_path}: {e}")
+        return None
+
 def calculate_media_dimensions(file_path):
     """Calculate and return dimensions for any media file (cached)."""
     try:
@@ -388,8 +1117,7 @@ def calculate_media_dimensions(file_path):
         if extension in [".yt"]:
             return (16, 9)
 
-        if extension not in [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif",
-                             ".tiff", ".webp", ".webm", ".mp4", ".avi", ".mkv", ".mov"]:
+        if dimension_job_kind(file_path) is None:
             return None
 
         # Check cache first
@@ -398,10 +1126,7 @@ def calculate_media_dimensions(file_path):
             return cached
 
         # Cache miss – compute
-        if extension in [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"]:
-            dims = get_image_dimensions(file_path)
-        else:
-            dims = get_video_dimensions(file_path)
+        dims = probe_media_dimensions(file_path)
 
         if dims:
             media_cache.put(file_path, dims[0], dims[1])
@@ -410,6 +1135,47 @@ def calculate_media_dimensions(file_path):
         print(f"Error getting dimensions for {file_path}: {e}")
         return None
 
+def resolve_media_dimensions(file_paths, pool, known=None):
+    """Batch version of calculate_media_dimensions: cache lookups happen here,
+    image misses are probed through the pool and video misses in one batched
+    ffprobe run. `known` holds dimensions an earlier stage already measured
+    (e.g. process_image); they skip the lookup. New results go into the cache
+    together. Returns {path: (w, h) or None}."""
+    results = {}
+    pending = {}
+    videos = []
+    fresh = {}
+    for file_path in file_paths:
+        if file_path in results or file_path in pending:
+            continue
+        if known and file_path in known:
+            results[file_path] = fresh[file_path] = tuple(known[file_path])
+            continue
+        if pathlib.Path(file_path).suffix.lower() == ".yt":
+            results[file_path] = (16, 9)
+            continue
+        kind = dimension_job_kind(file_path)
+        if kind is None:
+            results[file_path] = None
+            continue
+        cached = media_cache.get(file_path)
+        if cached:
+            results[file_path] = cached
+            continue
+        if kind == 'subprocess':
+            results[file_path] = None
+            videos.append(file_path)
+        else:
+            pending[file_path] = pool.submit_image(probe_media_dimensions, file_path)
+
+    fresh.update(probe_video_dimensions_batch(videos, max(FFPROBE_CONCURRENCY, pool.jobs)))
+    for file_path, future in pending.items():
+        fresh[file_path] = future.result()
+    fresh = {path: dims for path, dims in fresh.items() if dims}
+    media_cache.put_many(fresh)
+    results.update(fresh)
+    return results
+
 def validate_entries(entries):
     REQUIRED = {"id", "title", "theme"}  # adjust as needed
     errors = []
@@ -423,94 +1189,245 @@ def validate_entries(entries):
         raise SystemExit(f"Validation failed for {len(errors)} entries.")
 
 
-def process_entries(data):
-    """Enhanced version that calculates and stores media dimensions"""
-    themes = defaultdict(lambda: defaultdict(list))
+# Entries buffered between pipeline stages. Bounds memory and the number of
+# queued pool tasks however big the catalog; a few per worker keeps the
+# encoders fed while an entry waits on its thumbnail.
+PIPELINE_DEPTH = 8
+
+def process_entries(data, jobs=1, incremental=True, offline=False,
+                    youtube_base_url=YOUTUBE_THUMB_BASE_URL, partial=False, depth=PIPELINE_DEPTH):
+    """Enhanced version that calculates and stores media dimensions.
+
+    Entries stream through bounded stages: a scanner thread lists, cleans
+    and fingerprints folders ahead of the encoders; the compress stage
+    submits each dirty entry's files to a MediaPool; the thumbnail stage
+    collects them, probes dimensions and makes the thumbnail. At most depth
+    entries wait in each stage. With jobs > 1 the pool runs the media work
+    in parallel; entries are finished in catalog order, so the output is
+    identical to a serial run. With incremental=True, entries whose
+    fingerprint matches the build manifest reuse their previous results
+    without any media work. YouTube thumbnails are fetched from
+    youtube_base_url, or not at all when offline. partial=True processes a
+    slice of the catalog: thumbnail garbage collection and cache pruning
+    are skipped and the manifest keeps the entries that were not passed in.
+    """
     existing_folders = []
     existing_ids = {}
     entries_without_id = []
     FileListForCopyingAtTheEnd = []
+    manifest = BuildManifest() if incremental else None
     
     # Create thumbs directory if it doesn't exist
     thumbs_base_dir = 'public/thumbs'
     os.makedirs(thumbs_base_dir, exist_ok=True)
-    
-    for entry in data:
-        # Initialize thumbnail_override field
-        entry['thumbnail_override'] = ''
-        
-        # Initialize media_dimensions dictionary
-        entry['media_dimensions'] = {}
-        
-        if not entry['id']:
-            print(f"Entry without id: {entry['title']}")
-            entries_without_id.append(entry)
-            continue
-            
-        if entry['id'] in existing_ids:
-            raise SystemExit(f"ERROR: Duplicate id detected: '{entry['id']}'. Each entry must have a unique id.")
-        else:
-            existing_ids[entry['id']] = True
-        
-        theme_list = [theme.strip() for theme in entry['theme'].split(',')]
-        folder_theme = theme_list[0]
-        folder_path = os.path.join('entries', folder_theme, entry['id'])
-        os.makedirs(folder_path, exist_ok=True)
-        
-        file_list = [os.path.join(folder_path, f) for f in os.listdir(folder_path) 
-                    if os.path.isfile(os.path.join(folder_path, f))]
-        file_list = sort_files(file_list)
-        
-        updated_file_list = process_files(file_list)
-        entry['file_paths'] = updated_file_list
-        FileListForCopyingAtTheEnd.append(updated_file_list)
-        
-        # Calculate dimensions for all media files
-        for file_path in updated_file_list:
-            dimensions = calculate_media_dimensions(file_path)
-            if dimensions:
+
+    work = []   # (entry, folder_path, theme_list, cleaned file list or None if reused)
+    dirty = []
+    video_ids = []
+    scanned = queue.Queue(maxsize=depth)
+    stopping = threading.Event()   # set when a later stage failed
+
+    def scan():
+        """Stage 1 (scanner thread): validate ids, reuse clean entries, list
+        and clean the rest."""
+        t_stage = time.monotonic_ns()
+        try:
+            for entry in data:
+                if stopping.is_set():
+                    return
+                if not entry['id']:
+                    entry['thumbnail_override'] = ''
+                    entry['media_dimensions'] = {}
+                    print(f"Entry without id: {entry['title']}")
+                    entries_without_id.append(entry)
+                    continue
+
+                if entry['id'] in existing_ids:
+                    raise SystemExit(f"ERROR: Duplicate id detected: '{entry['id']}'. Each entry must have a unique id.")
+                else:
+                    existing_ids[entry['id']] = True
+
+                theme_list = [theme.strip() for theme in entry['theme'].split(',')]
+                folder_theme = theme_list[0]
+                folder_path = os.path.join('entries', folder_theme, entry['id'])
+                os.makedirs(folder_path, exist_ok=True)
+
+                if manifest:
+                    previous = manifest.lookup(entry['id'], entry_fingerprint(entry, folder_path), thumbs_base_dir)
+                    if previous:
+                        entry['thumbnail_override'] = previous['thumbnail_override']
+                        entry['media_dimensions'] = previous['media_dimensions']
+                        entry['file_paths'] = previous['file_paths']
+                        work.append((entry, folder_path, theme_list, None))
+                        continue
+
+                # Initialize thumbnail_override field
+                entry['thumbnail_override'] = ''
+
+                # Initialize media_dimensions dictionary
+                entry['media_dimensions'] = {}
+
+                file_list = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
+                             if os.path.isfile(os.path.join(folder_path, f))]
+                file_list = sort_files(file_list)
+                file_list = [f for f in map(clean_filename, file_list) if f is not None]
+                item = (entry, folder_path, theme_list, file_list)
+                work.append(item)
+                dirty.append(item)
+                scanned.put(item)
+            tracer.record('scan', t_stage, entries=len(work), dirty=len(dirty))
+        except BaseException as e:
+            scanned.put(e)
+            return
+        scanned.put(None)
+
+    def submit_compress(item):
+        """Stage 2: compress / convert every file of an entry. Images go
+        through the single-decode stage, which also makes the entry
+        thumbnail when the image is the entry's first file."""
+        jobs_for_entry = []
+        for index, f in enumerate(item[3]):
+            kind = media_job_kind(f)
+            makes_thumb = index == 0 and pathlib.Path(f).suffix.lower() in [".jpg", ".jpeg", ".png"]
+            if kind == 'image':
+                future = pool.submit_image(process_image, f, ENCODER_SETTINGS['max_filesize'],
+                                           thumbs_base_dir if makes_thumb else None)
+            elif kind:
+                future = pool.submit_subprocess(process_media_file, f)
+            else:
+                future = None
+            jobs_for_entry.append((future, f, makes_thumb))
+        return item, jobs_for_entry
+
+    def submit_thumbnail(item, jobs_for_entry):
+        """Stage 3: collect an entry's files, record their dimensions and
+        start its thumbnail from the first media file, unless stage 2 made
+        it. Returns the thumbnail future, or the path (None if there is
+        none)."""
+        entry = item[0]
+        known_dimensions = {}
+        variants = {}
+        outputs = []
+        thumb_path = False
+        for future, f, makes_thumb in jobs_for_entry:
+            if future is None:
+                outputs.append(f)
+                continue
+            result = future.result()
+            if isinstance(result, dict):
+                if result['dimensions']:
+                    known_dimensions[result['path']] = result['dimensions']
+                if result['variants']:
+                    variants[result['path']] = result['variants']
+                if makes_thumb:
+                    thumb_path = result['thumbnail']
+                result = result['path']
+            outputs.append(result)
+        entry['file_paths'] = filter_video_files(outputs)
+        video_ids.append(youtube_video_id(entry, item[1]))
+
+        dimensions = resolve_media_dimensions(entry['file_paths'], pool, known_dimensions)
+        for file_path in entry['file_paths']:
+            dims = dimensions.get(file_path)
+            if dims:
                 # Store dimensions with the file path as key
                 entry['media_dimensions'][file_path] = {
-                    'width': dimensions[0],
-                    'height': dimensions[1]
+                    'width': dims[0],
+                    'height': dims[1]
                 }
-        
-        # Check if a thumbnail can be generated from the first image
-        # Check if a thumbnail can be generated from the first media file
-        if updated_file_list:
-            first_file = updated_file_list[0]
+                # Responsive ladder for srcset, smallest first per format
+                if file_path in variants:
+                    entry['media_dimensions'][file_path]['variants'] = variants[file_path]
+
+        if thumb_path is False and entry['file_paths']:
+            first_file = entry['file_paths'][0]
             extension = pathlib.Path(first_file).suffix.lower()
-            
-            # Generate image thumbnail
-            if extension in [".jpg", ".jpeg", ".png", ".webp", ".gif"]:
-                img_thumb_path = generate_image_thumbnail(first_file, thumbs_base_dir)
-                if img_thumb_path:
-                    entry['thumbnail_override'] = img_thumb_path
-                    # Calculate dimensions for the thumbnail
-                    thumb_full_path = os.path.join(thumbs_base_dir, os.path.basename(img_thumb_path))
-                    thumb_dims = calculate_media_dimensions(thumb_full_path)
-                    if thumb_dims:
-                        entry['media_dimensions'][img_thumb_path] = {
-                            'width': thumb_dims[0],
-                            'height': thumb_dims[1]
-                        }
-            
+            # Animated GIFs are routed through ffmpeg
+            if extension == ".gif":
+                return pool.submit_subprocess(generate_image_thumbnail, first_file, thumbs_base_dir)
+            elif extension in [".jpg", ".jpeg", ".png", ".webp"]:
+                return pool.submit_image(generate_image_thumbnail, first_file, thumbs_base_dir)
             # Generate video thumbnail for WebM/MP4 files
             elif extension in [".webm", ".mp4"]:
-                video_thumb_path = generate_video_thumbnail(first_file, thumbs_base_dir)
-                if video_thumb_path:
-                    entry['thumbnail_override'] = video_thumb_path
-                    # Video thumbnails maintain aspect ratio, calculate actual dimensions
-                    thumb_full_path = os.path.join(thumbs_base_dir, os.path.basename(video_thumb_path))
-                    thumb_dims = calculate_media_dimensions(thumb_full_path)
-                    if thumb_dims:
-                        entry['media_dimensions'][video_thumb_path] = {
-                            'width': thumb_dims[0],
-                            'height': thumb_dims[1]
-                        }
+                poster_time = entry.get('poster_time', ENCODER_SETTINGS['video_poster_time'])
+                return pool.submit_subprocess(generate_video_thumbnail, first_file, thumbs_base_dir,
+                                              ENCODER_SETTINGS['video_thumb_size'], poster_time)
+        return thumb_path or None
+
+    def collect(item, jobs_for_entry):
+        thumbnailing.append((item, submit_thumbnail(item, jobs_for_entry)))
+        if len(thumbnailing) > depth:
+            finish(*thumbnailing.popleft())
+
+    def finish(item, thumb):
+        """Stage 4: the thumbnail and its dimensions (thumbnails maintain
+        aspect ratio, so the actual size is recorded)."""
+        thumb_path = thumb if thumb is None or isinstance(thumb, str) else thumb.result()
+        if thumb_path:
+            thumb_full_path = os.path.join(thumbs_base_dir, os.path.basename(thumb_path))
+            thumb_dims = resolve_media_dimensions([thumb_full_path], pool).get(thumb_full_path)
+            thumb_paths[id(item)] = thumb_path, thumb_dims
+
+    thumb_paths = {}   # id(dirty item) -> (thumbnail path, dimensions)
+    with MediaPool(jobs) as pool:
+        scanner = threading.Thread(target=scan, name='scan-entries', daemon=True)
+        scanner.start()
+
+        # Each deque holds at most depth entries; when one is full its
+        # oldest entry moves on, which blocks until that entry's work is done
+        t_stage = time.monotonic_ns()
+        compressing = deque()
+        thumbnailing = deque()
+        try:
+            while True:
+                item = scanned.get()
+                if isinstance(item, BaseException):
+                    raise item
+                if item is None:
+                    break
+                compressing.append(submit_compress(item))
+                if len(compressing) > depth:
+                    collect(*compressing.popleft())
+            while compressing:
+                collect(*compressing.popleft())
+        except BaseException:
+            # Let the scanner see the flag instead of blocking on a full queue
+            stopping.set()
+            while scanner.is_alive():
+                try:
+                    scanned.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        scanner.join()
+
+        # Every entry's file_paths are known now, so the YouTube thumbnails
+        # download while the last thumbnails are made
+        youtube_future = pool.submit_subprocess(
+            fetch_youtube_thumbnails, [v for v in video_ids if v], thumbs_base_dir,
+            offline, youtube_base_url, max(YOUTUBE_FETCH_CONCURRENCY, pool.jobs))
+        while thumbnailing:
+            finish(*thumbnailing.popleft())
+        tracer.record('encode', t_stage, entries=len(dirty))
+
+        t_stage = time.monotonic_ns()
+        youtube_thumbs = youtube_future.result()
+        tracer.record('youtube_wait', t_stage)
+
+    rungs_removed, rungs_freed = 0, 0
+    for item, video_id in zip(dirty, video_ids):
+        entry, folder_path, _, _ = item
+        thumb_path, thumb_dims = thumb_paths.get(id(item), (None, None))
+        if thumb_path:
+            entry['thumbnail_override'] = thumb_path
+            if thumb_dims:
+                entry['media_dimensions'][thumb_path] = {
+                    'width': thumb_dims[0],
+                    'height': thumb_dims[1]
+                }
         
         # Process YouTube thumbnails
-        thumbnail_path = process_youtube_thumbnails(entry, folder_path, thumbs_base_dir)
+        thumbnail_path = youtube_thumbs.get(video_id) if video_id else None
         if thumbnail_path:
             entry['thumbnail_override'] = thumbnail_path
             # YouTube thumbnails are typically 16:9
@@ -518,71 +1435,145 @@ def process_entries(data):
                 'width': 1280,
                 'height': 720
             }
-        
+
+        # Before fingerprinting, so the folder listing is final
+        removed, freed = collect_derivative_garbage(entry, folder_path)
+        rungs_removed += removed
+        rungs_freed += freed
+
+        if manifest and not (video_id and not thumbnail_path):
+            # Fingerprint the folder as processing left it (renames, _c_ copies).
+            # Entries still missing their YouTube thumbnail stay dirty, so the
+            # download is retried once the failure TTL runs out.
+            manifest.record(entry['id'], entry_fingerprint(entry, folder_path), entry)
+
+    for entry, folder_path, _, _ in work:
+        FileListForCopyingAtTheEnd.append(published_files(entry))
         existing_folders.append(folder_path)
-        
+    themes = group_by_theme(entry for entry, _, _, _ in work)
+
+    if not partial:
+        # Every entry was seen above, so any thumbnail nobody references is an orphan
+        removed, freed = collect_thumbnail_garbage(thumbs_base_dir, referenced_thumbnails(data))
+        if removed:
+            print(f"  Thumbnails: removed {removed} orphaned files ({freed / 1e6:.1f} MB)")
+    if rungs_removed:
+        print(f"  Derivatives: removed {rungs_removed} stale files ({rungs_freed / 1e6:.1f} MB)")
+
+    # Persist dimension cache and report stats
+    pruned = 0 if partial else media_cache.save()
+    print(f"  Dimensions cache: {media_cache.hits} hits, {media_cache.misses} misses, {pruned} pruned")
+    if manifest:
+        manifest.save(keep_unseen=partial)
+        print(f"  Build manifest: {manifest.reused} entries reused, {manifest.rebuilt} rebuilt")
+
+    return themes, existing_folders, entries_without_id, FileListForCopyingAtTheEnd
+
+def published_files(entry):
+    """An entry's media files plus its derivatives, which aren't listed in
+    file_paths but still need publishing."""
+    return entry['file_paths'] + [variant['path'] for dims in entry['media_dimensions'].values()
+                                  for variant in dims.get('variants', [])]
+
+def load_processed_entries(data, jobs=1, offline=False, youtube_base_url=YOUTUBE_THUMB_BASE_URL):
+    """Fill in the media fields of data from the build manifest, for the
+    commands that don't do media work. Entries changed since the last build
+    go through process_entries first, so the result always matches a full
+    run. Returns (themes, file lists to publish)."""
+    manifest = BuildManifest()
+    seen = set()
+    stale = []
+    for entry in data:
+        if not entry['id']:
+            entry['thumbnail_override'] = ''
+            entry['media_dimensions'] = {}
+            continue
+        if entry['id'] in seen:
+            raise SystemExit(f"ERROR: Duplicate id detected: '{entry['id']}'. Each entry must have a unique id.")
+        seen.add(entry['id'])
+        record = manifest.lookup(entry['id'], entry_fingerprint(entry, entry_folder(entry)), 'public/thumbs')
+        if record:
+            for field in ('thumbnail_override', 'media_dimensions', 'file_paths'):
+                entry[field] = record[field]
+        else:
+            stale.append(entry)
+    if stale:
+        print(f"  {len(stale)} entries changed since the last media build, processing them first")
+        process_entries(stale, jobs=jobs, offline=offline, youtube_base_url=youtube_base_url, partial=True)
+    else:
+        print(f"  Build manifest: all {len(seen)} entries current")
+    entries = [entry for entry in data if entry['id']]
+    return group_by_theme(entries), [published_files(entry) for entry in entries]
+
+def group_by_theme(entries):
+    """theme -> year -> entries, one copy of each entry per theme it lists.
+    Recommendations stay out of the copies, they only go to compiled.json."""
+    themes = defaultdict(lambda: defaultdict(list))
+    for entry in entries:
         # Create a copy of the entry for each theme
-        for theme in theme_list:
+        for theme in entry['theme'].split(','):
             theme = theme.strip()
-            entry_copy = entry.copy()
+            entry_copy = {k: v for k, v in entry.items() if k != 'recommended_ids'}
             entry_copy['theme'] = theme
             themes[theme][entry['year']].append(entry_copy)
-    
-    # Persist dimension cache and report stats
-    media_cache.save()
-    print(f"  Dimensions cache: {media_cache.hits} hits, {media_cache.misses} misses")
+    return themes
 
-    return themes, existing_folders, entries_without_id, FileListForCopyingAtTheEnd
+HTML_ENTRY_DATA = ('inline', 'id')
 
-def generate_html_content(themes):
-    html_content = ""
-    year_themes = {}
+def write_html_content(themes, out, entry_data='inline'):
+    """Stream the entry list to out, newest year first. entry_data='inline'
+    embeds each record as JSON in data-entry; 'id' only writes data-entry-id
+    and leaves the record to compiled.json."""
+    year_themes = defaultdict(set)
     all_entries = []
-    
+
     # Collect all entries and their themes
     for theme, year_entries in themes.items():
         for year, entries in year_entries.items():
-            for entry in entries:
-                # Create a new entry with all themes for display
-                display_entry = entry.copy()
-                all_entries.append(display_entry)
-                
-                # Track themes for each year
-                if year not in year_themes:
-                    year_themes[year] = set()
-                year_themes[year].add(theme.lower())
-    
-    # Sort entries by year
+            all_entries.extend(entries)
+            # Track themes for each year
+            year_themes[year].add(theme.lower())
+
+    # Group by year once instead of sorting every entry
     try:
-        all_entries.sort(key=lambda x: int(x['year']), reverse=True)
+        by_year = defaultdict(list)
+        for entry in all_entries:
+            by_year[int(entry['year'])].append(entry)
+        all_entries = [entry for year in sorted(by_year, reverse=True) for entry in by_year[year]]
     except Exception as e:
         print(f"Error sorting entries: {e}")
         print("Entries will be unsorted")
-    
-    # Generate HTML
-    html_content += '<div class="subgroup">'
+
+    out.write('<div class="subgroup">')
     current_year = None
-    
+
     for entry in all_entries:
         if entry['year'] != current_year:
             current_year = entry['year']
-            year_theme_classes = ' '.join([f"{theme}text" for theme in year_themes[current_year]])
-            html_content += f'<p class="year {year_theme_classes}">{current_year}</p>\n'
-        
-        entry_json = json.dumps(entry)
-        entry_json_escaped = html.escape(entry_json)
+            year_theme_classes = ' '.join(f"{theme}text" for theme in sorted(year_themes[current_year]))
+            out.write(f'<p class="year {year_theme_classes}">{current_year}</p>\n')
+
+        if entry_data == 'id':
+            data_attr = f'data-entry-id="{html.escape(entry["id"])}"'
+        else:
+            data_attr = f"data-entry='{html.escape(json.dumps(entry))}'"
         locked_class = "lost " if entry.get('locked', False) else ""
         theme_class = f"{entry['theme'].lower()}text"
-        
+
         tags = entry.get("tags", "")
         first_tag = tags.split(",")[0] if tags else " "
         first_tag = first_tag.replace("-", " ").replace("_", " ")
-        
-        html_content += f'<p class="title {theme_class}"><a target="_blank" href="#{entry["id"]}" data-entry=\'{entry_json_escaped}\' class="{locked_class}subtext"><span class="small">{first_tag}</span> {entry["title"]}</a></p>\n'
-    
-    html_content += '</div>'
-    return html_content
 
+        out.write(f'<p class="title {theme_class}"><a target="_blank" href="#{entry["id"]}" {data_attr} class="{locked_class}subtext"><span class="small">{first_tag}</span> {entry["title"]}</a></p>\n')
+
+    out.write('</div>')
+
+def generate_html_content(themes, entry_data='inline'):
+    buffer = io.StringIO()
+    write_html_content(themes, buffer, entry_data)
+    return buffer.getvalue()
+
+@traced('ffmpeg_encode')
 def compress_video_if_needed(filename, max_filesize_bytes=500000000):
     """Convert videos to WebM format, with size-based quality adjustment"""
     
@@ -655,63 +1646,181 @@ def filter_video_files(file_list):
     
     return filtered_files
 
-def compress_image_if_needed(filename, max_filesize):
+def has_alpha(img):
+    """True if an opened image carries transparency."""
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+def image_orientation(img):
+    """EXIF orientation of an opened image, or None."""
+    try:
+        return img.getexif().get(EXIF_ORIENTATION_TAG)
+    except Exception:
+        return None # No EXIF data
+
+def apply_orientation(img, orientation):
+    """Rotate for the EXIF orientations the pipeline corrects (3, 6, 8)."""
+    if orientation == 3:
+        return img.rotate(180, expand=True)
+    elif orientation == 6:
+        return img.rotate(270, expand=True)
+    elif orientation == 8:
+        return img.rotate(90, expand=True)
+    return img
+
+def derivative_plan(web_path, pixel_size, source_digest=None):
+    """[(format, width, height, path)] of the responsive ladder for a web
+    image whose pixels are pixel_size. Never upscales; formats this Pillow
+    build can't write are skipped. Names carry the source's extension and a
+    key of its content and the encoder settings, so foo.png and foo.jpg
+    don't collide and an edited source gets fresh rungs."""
+    from PIL import Image
+
+    base_name, extension = os.path.splitext(os.path.basename(web_path))
+    if base_name.startswith('_c_'):
+        base_name = base_name[len('_c_'):]
+    base_name = f"{base_name}_{extension.lstrip('.').lower()}"
+    dir_name = os.path.dirname(web_path)
+    width, height = pixel_size
+    plan = []
+    Image.init()   # Image.SAVE is only complete once every plugin is loaded
+    for fmt in ENCODER_SETTINGS['derivative_formats']:
+        if fmt.upper() not in Image.SAVE:
+            continue
+        payload = json.dumps([source_digest or web_path, fmt,
+                              ENCODER_SETTINGS['derivative_encoders'].get(fmt, {})], sort_keys=True)
+        key = hashlib.md5(payload.encode()).hexdigest()[:10]
+        for w in sorted(set(ENCODER_SETTINGS['derivative_widths'])):
+            if w >= width:
+                continue
+            h = max(1, round(height * w / width))
+            plan.append((fmt, w, h, os.path.join(dir_name, f"_c_{base_name}_{key}_w{w}.{fmt}")))
+    return plan
+
+def write_derivatives(img, plan):
+    """Resize an oriented RGB / RGBA image to every missing rung of the ladder."""
+    from PIL import Image
+
+    for fmt, w, h, path in plan:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        img.resize((w, h), Image.Resampling.LANCZOS).save(
+            tmp_path, fmt.upper(), **ENCODER_SETTINGS['derivative_encoders'].get(fmt, {}))
+        os.replace(tmp_path, path)
+        print(f"  ✓ Generated {w}px {fmt} for {os.path.basename(path)}")
+
+@traced('compress_image')
+def process_image(filename, max_filesize, thumbs_base_dir=None,
+                  thumb_size=(ENCODER_SETTINGS['thumb_size'], ENCODER_SETTINGS['thumb_size']),
+                  derivatives=True):
+    """
+    Single-decode image stage. From at most one decode of the source it
+    produces the _c_ web copy (when the source is too big or needs rotating),
+    the responsive derivative ladder, the thumbnail (when thumbs_base_dir is
+    given), and the dimensions and EXIF orientation of the file to use.
+
+    Returns {'path', 'thumbnail', 'dimensions', 'orientation', 'variants'};
+    'variants' lists {'path', 'format', 'width', 'height', 'bytes'} per
+    derivative.
+    """
+    from PIL import Image
+
+    result = {'path': filename, 'thumbnail': None, 'dimensions': None, 'orientation': None,
+              'variants': []}
     if pathlib.Path(filename).suffix.lower() not in [".png", ".jpg", ".jpeg"]:
         print(f"{filename} is not a recognised image file.")
-        return filename
+        return result
 
-    # Check if a compressed version already exists — fast path
+    # An existing compressed version is only reused if it was made from the
+    # source's current bytes — fast path
     compressed_filename = os.path.join(
         os.path.dirname(filename), f"_c_{os.path.basename(filename)}")
-    if os.path.isfile(compressed_filename):
-        return compressed_filename
+    source_digest = media_cache.content_digest(filename)
+    compressed_exists = (os.path.isfile(compressed_filename) and source_digest is not None
+                         and media_cache.copy_source(compressed_filename) == source_digest)
+    if not compressed_exists and os.path.isfile(compressed_filename):
+        # Made from other bytes; rebuilt below if the source still needs it
+        os.remove(compressed_filename)
+    source = compressed_filename if compressed_exists else filename
+
+    with Image.open(source) as img:
+        # Opening only parses the header; EXIF is read from there too
+        orientation = image_orientation(img)
+        result['orientation'] = orientation
+        needs_rotation = orientation in [3, 6, 8]
+        # Get the filesize
+        needs_compression = not compressed_exists and os.path.getsize(filename) > max_filesize
+
+        # If the file size is over the limit or needs rotation
+        # Derivatives keep transparency; the JPEG copy and thumbnail can't
+        mode = 'RGBA' if has_alpha(img) else 'RGB'
+        if not compressed_exists and (needs_compression or needs_rotation):
+            # Full decode. Most photos already decode as RGB, so skip the
+            # extra full-size copy.
+            img.load()
+            out = img if img.mode == mode else img.convert(mode)
 
-    # Get the filesize
-    file_size = os.path.getsize(filename)
-    needs_compression = file_size > max_filesize
-    needs_rotation = False
-    exif = None
+            # Rotate image if needed
+            if needs_rotation:
+                out = apply_orientation(out, orientation)
+            if out is not img:
+                img.close()   # release the decoded source before encoding
 
-    # Open the image to check EXIF for rotation info
-    with Image.open(filename) as img:
-        try:
-            for orientation in ExifTags.TAGS.keys():
-                if ExifTags.TAGS[orientation] == 'Orientation':
-                    break
-            exif = img._getexif()
-            if exif is not None and exif[orientation] in [3, 6, 8]:
-                needs_rotation = True
-
-        except (AttributeError, KeyError, IndexError):
-            # Image didn't have EXIF data
-            pass
+            # Save the image as a compressed JPEG
+            tmp_path = f"{compressed_filename}.{os.getpid()}.tmp"
+            (out if out.mode == 'RGB' else out.convert('RGB')).save(
+                tmp_path, "JPEG", optimize=True, quality=ENCODER_SETTINGS['image_quality'])
+            os.replace(tmp_path, compressed_filename)
+            if source_digest:
+                media_cache.record_copy(compressed_filename, source_digest)
+            result['path'] = compressed_filename
+            result['dimensions'] = pixel_size = out.size
+        else:
+            # The file is used as-is; only derivatives / thumbnail need pixels
+            out = None
+            result['path'] = source
+            pixel_size = img.size
+            result['dimensions'] = _oriented(img.size[0], img.size[1],
+                                             orientation if img.format == 'JPEG' else None)
+
+        plan = derivative_plan(result['path'], pixel_size, source_digest) if derivatives else []
+        missing = [rung for rung in plan if not os.path.exists(rung[3])]
+        thumb_rel_path = thumb_full_path = None
+        if thumbs_base_dir:
+            # Keyed on the source, so a replaced source never reuses a thumbnail
+            thumb_rel_path, thumb_full_path = image_thumbnail_paths(filename, thumbs_base_dir, thumb_size)
+        needs_thumb = thumb_full_path is not None and not os.path.exists(thumb_full_path)
 
-    # If the file size is over the limit or needs rotation
-    if needs_compression or needs_rotation:
-        # Reopen the image file
-        with Image.open(filename) as img:
-            # Convert the image to RGB (removes alpha if present)
-            img = img.convert('RGB')
+        try:
+            if out is None and (missing or needs_thumb):
+                # Reduced-size JPEG decode: only what the ladder / thumbnail need
+                draft_size = (thumb_size[0] * 2, thumb_size[1] * 2) if needs_thumb else (1, 1)
+                for _, w, h, _ in missing:
+                    draft_size = (max(draft_size[0], w), max(draft_size[1], h))
+                img.draft('RGB', draft_size)
+                out = apply_orientation(img, orientation).convert(mode)
+            if missing:
+                write_derivatives(out, missing)
+        except Exception as e:
+            print(f"  ✗ Failed to create derivatives for {result['path']}: {e}")
+        result['variants'] = [
+            {'path': path, 'format': fmt, 'width': w, 'height': h, 'bytes': os.path.getsize(path)}
+            for fmt, w, h, path in plan if os.path.exists(path)
+        ]
 
-            # Rotate image if needed
-            if needs_rotation:
-                print(exif[orientation])
-                if exif[orientation] == 3:
-                    img = img.rotate(180, expand=True)
-                elif exif[orientation] == 6:
-                    img = img.rotate(270, expand=True)
-                elif exif[orientation] == 8:
-                    img = img.rotate(90, expand=True)
+        if thumbs_base_dir:
+            try:
+                if needs_thumb:
+                    # Thumbnailing shrinks in place, so it goes last
+                    save_thumbnail(out if out.mode == 'RGB' else out.convert('RGB'),
+                                   thumb_full_path, thumb_size)
+                    print(f"  ✓ Generated thumbnail for {os.path.basename(result['path'])}")
+                result['thumbnail'] = thumb_rel_path
+            except Exception as e:
+                print(f"  ✗ Failed to create thumbnail for {result['path']}: {e}")
 
-            # Save the image as a compressed JPEG
-            img.save(compressed_filename, "JPEG", optimize=True, quality=85)
-        
-        # Return the compressed filename
-        return compressed_filename
+    return result
 
-    # If neither condition is met, return the original filename
-    else:
-        return filename
+def compress_image_if_needed(filename, max_filesize):
+    return process_image(filename, max_filesize, derivatives=False)['path']
 
 def sort_files(file_list):
     def get_sort_key(filename):
@@ -726,34 +1835,300 @@ def sort_files(file_list):
     file_list.sort(key=get_sort_key)
     return file_list
 
+# ---------------------------------------------------------------------------
+# Header-only dimension probing – reads just enough of PNG / JPEG / GIF /
+# WebP / Matroska-WebM files to find the frame size. Anything it can't parse
+# returns None and falls back to PIL / ffprobe.
+# ---------------------------------------------------------------------------
+EXIF_ORIENTATION_TAG = 0x0112
+
+def _oriented(width, height, orientation):
+    """Swap width/height for EXIF orientations 5-8 (the transposed ones)."""
+    if orientation in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+def _exif_orientation(tiff):
+    """Orientation value from a raw TIFF/EXIF block, or None."""
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return None
+    endian = '<' if tiff[:2] == b'II' else '>'
+    ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+    if ifd_offset + 2 > len(tiff):
+        return None
+    count = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+    for i in range(count):
+        pos = ifd_offset + 2 + i * 12
+        if pos + 12 > len(tiff):
+            break
+        tag, typ = struct.unpack(endian + 'HH', tiff[pos:pos + 4])
+        if tag == EXIF_ORIENTATION_TAG and typ == 3:   # SHORT
+            return struct.unpack(endian + 'H', tiff[pos + 8:pos + 10])[0]
+    return None
+
+def _png_dimensions(f, head):
+    if head[:8] != b'\x89PNG\r\n\x1a\n' or head[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', head[16:24])
+
+def _gif_dimensions(f, head):
+    if head[:6] not in (b'GIF87a', b'GIF89a'):
+        return None
+    return struct.unpack('<HH', head[6:10])
+
+def _webp_dimensions(f, head):
+    if head[:4] != b'RIFF' or head[8:12] != b'WEBP':
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        w, h = struct.unpack('<HH', head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b'VP8L' and head[20] == 0x2F:
+        b0, b1, b2, b3 = head[21:25]
+        return (1 + (((b1 & 0x3F) << 8) | b0),
+                1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6)))
+    if chunk == b'VP8X':
+        return (1 + int.from_bytes(head[24:27], 'little'),
+                1 + int.from_bytes(head[27:30], 'little'))
+    return None
+
+def _jpeg_dimensions(f, head):
+    if head[:2] != b'\xff\xd8':
+        return None
+    f.seek(2)
+    orientation = None
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':            # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code == 0xD8 or code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue                        # standalone markers
+        if code in (0xD9, 0xDA):            # EOI / SOS before any SOF
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if code == 0xE1 and orientation is None:
+            segment = f.read(length - 2)
+            if segment[:6] == b'Exif\x00\x00':
+                orientation = _exif_orientation(segment[6:])
+        elif 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            segment = f.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return _oriented(width, height, orientation)
+        else:
+            f.seek(length - 2, 1)
+
+# Matroska / WebM element ids
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_CLUSTER = 0x1F43B675
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+
+def _ebml_vint(buf, pos, keep_marker=False):
+    """Decode an EBML variable-length integer at buf[pos].
+    Returns (value, new_pos); value is None for the 'unknown size' marker."""
+    first = buf[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(buf):
+        raise ValueError("bad EBML vint")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = value == mask - 1
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    if all_ones and not keep_marker:
+        return None, pos + length
+    return value, pos + length
+
+def _ebml_header(f):
+    """Read one element header from a file; returns (id, size) or None at EOF."""
+    start = f.tell()
+    buf = f.read(12)
+    if not buf:
+        return None
+    elem_id, pos = _ebml_vint(buf, 0, keep_marker=True)
+    size, pos = _ebml_vint(buf, pos)
+    f.seek(start + pos)
+    return elem_id, size
+
+def _ebml_children(buf):
+    pos = 0
+    while pos < len(buf):
+        elem_id, pos = _ebml_vint(buf, pos, keep_marker=True)
+        size, pos = _ebml_vint(buf, pos)
+        if size is None:
+            size = len(buf) - pos
+        yield elem_id, buf[pos:pos + size]
+        pos += size
+
+def _mkv_dimensions(f, head):
+    if head[:4] != EBML_HEADER.to_bytes(4, 'big'):
+        return None
+    f.seek(0)
+    _, size = _ebml_header(f)
+    f.seek(size, 1)
+    header = _ebml_header(f)
+    if not header or header[0] != MKV_SEGMENT:
+        return None
+    # Walk the segment's top-level children until the Tracks element
+    while True:
+        header = _ebml_header(f)
+        if header is None:
+            return None
+        elem_id, size = header
+        if elem_id == MKV_CLUSTER or size is None:
+            return None     # Tracks written after the media data – let ffprobe handle it
+        if elem_id != MKV_TRACKS:
+            f.seek(size, 1)
+            continue
+        for track_id, track in _ebml_children(f.read(min(size, 1 << 20))):
+            if track_id != MKV_TRACK_ENTRY:
+                continue
+            fields = dict(_ebml_children(track))
+            if int.from_bytes(fields.get(MKV_TRACK_TYPE, b''), 'big') != 1:   # 1 = video
+                continue
+            video = dict(_ebml_children(fields.get(MKV_VIDEO, b'')))
+            if MKV_PIXEL_WIDTH in video and MKV_PIXEL_HEIGHT in video:
+                return (int.from_bytes(video[MKV_PIXEL_WIDTH], 'big'),
+                        int.from_bytes(video[MKV_PIXEL_HEIGHT], 'big'))
+        return None
+
+HEADER_PARSERS = (
+    _png_dimensions,
+    _jpeg_dimensions,
+    _gif_dimensions,
+    _webp_dimensions,
+    _mkv_dimensions,
+)
+
+def read_header_dimensions(path):
+    """(width, height) from the file header alone, or None if the format
+    isn't handled or the header doesn't look right.
+
+    Formats are sniffed from the magic bytes, not the extension – _c_ copies
+    of PNGs are JPEG data behind a .png name.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            for parser in HEADER_PARSERS:
+                dims = parser(f, head)
+                if dims:
+                    break
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
+    if dims and dims[0] > 0 and dims[1] > 0:
+        return tuple(dims)
+    return None
+
 def get_image_dimensions(image_path):
-    _, extension = os.path.splitext(image_path)
-    extension = extension.lower()
-    
-    if extension != ".gif":
-        with Image.open(image_path) as img:
-            return img.size  # Returns (width, height)
-    else:
-        img = imageio.v2.imread(image_path)
-        return img.shape[1], img.shape[0]  # Returns (width, height)
+    dims = read_header_dimensions(image_path)
+    if dims:
+        return dims
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+        return _oriented(img.size[0], img.size[1], orientation)  # Returns (width, height)
+
+FFPROBE_DIMENSIONS_CMD = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+                          "-show_entries", "stream=height,width", "-of", "json"]
+
+# Upper bound on ffprobe processes running at once during a batched probe
+FFPROBE_CONCURRENCY = 8
+
+def _parse_ffprobe_dimensions(output):
+    dimensions = json.loads(output)['streams'][0]
+    return dimensions['width'], dimensions['height']
 
 def get_video_dimensions(video_path):
     """Updated to handle WebM files"""
+    dims = read_header_dimensions(video_path)
+    if dims:
+        return dims
     try:
-        cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", 
-               "-show_entries", "stream=height,width", "-of", "json", video_path]
+        cmd = FFPROBE_DIMENSIONS_CMD + [video_path]
         result = subprocess.run(cmd, stdout=subprocess.PIPE, 
                               stderr=subprocess.STDOUT, text=True, check=True)
-        dimensions = json.loads(result.stdout)['streams'][0]
-        return dimensions['width'], dimensions['height']
+        return _parse_ffprobe_dimensions(result.stdout)
     except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError, IndexError) as e:
         print(f"Error getting video dimensions for {video_path}: {e}")
         return (16, 9)  # Fallback aspect ratio
-    
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
 
+async def _ffprobe_dimensions_async(video_path, semaphore):
+    import asyncio
+
+    async with semaphore:
+        with span('ffprobe', cat='media', tid=id(asyncio.current_task()), path=video_path):
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *FFPROBE_DIMENSIONS_CMD, video_path,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            except OSError as e:
+                print(f"Error getting dimensions for {video_path}: {e}")
+                return None
+            output, _ = await proc.communicate()
+    try:
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, FFPROBE_DIMENSIONS_CMD[0])
+        return _parse_ffprobe_dimensions(output)
+    except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError, IndexError) as e:
+        print(f"Error getting video dimensions for {video_path}: {e}")
+        return (16, 9)  # Fallback aspect ratio
+
+def probe_video_dimensions_batch(video_paths, max_concurrency=FFPROBE_CONCURRENCY):
+    """Dimensions for many videos at once: {path: (w, h) or None}.
+
+    Headers are parsed in-process first; whatever is left is handed to
+    ffprobe through an asyncio subprocess pool, at most max_concurrency
+    processes at a time.
+    """
+    import asyncio
+
+    results = {}
+    remaining = []
+    for video_path in video_paths:
+        dims = read_header_dimensions(video_path)
+        if dims:
+            results[video_path] = dims
+        else:
+            remaining.append(video_path)
+    if not remaining:
+        return results
+
+    async def probe_all():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*(_ffprobe_dimensions_async(p, semaphore) for p in remaining))
+
+    print(f"  Probing {len(remaining)} videos with ffprobe ({max_concurrency} at a time)...")
+    results.update(zip(remaining, asyncio.run(probe_all())))
+    return results
+    
 def generate_sitemap(themes, base_url="https://colter.us/"):
+    from xml.etree.ElementTree import Element, SubElement, tostring
+    from xml.dom import minidom
+
     urlset = Element("urlset", xmlns="http://www.sitemaps.org/schemas/sitemap/0.9")
 
     for theme, years in themes.items():
@@ -777,222 +2152,236 @@ def generate_sitemap(themes, base_url="https://colter.us/"):
 # The 'data' list has been modified in-place by 'process_entries'
 # Now we save this enriched data structure to a single file.
 
-import math
-import re
-from collections import Counter, defaultdict
+# ---------------------------------------------------------------------------
+# Recommendations – TF-IDF text and tag vectors plus a temporal Gaussian,
+# scored by one of three engines: 'python' (the original pairwise loop),
+# 'numpy' (CSR matrix products scored in row blocks) or 'index' (exact
+# scores over inverted-index candidates only). python and numpy produce the
+# same recommended_ids; index trades a little recall for sub-quadratic work.
+# 'auto' picks numpy when NumPy and SciPy are installed, index for big
+# catalogs.
+# ---------------------------------------------------------------------------
+class SparseVector:
+    """Efficient sparse vector representation."""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.values = {}  # Only store non-zero values
+
+    def set(self, index, value):
+        if value != 0:
+            self.values[index] = value
+        elif index in self.values:
+            del self.values[index]
+
+    def get(self, index):
+        return self.values.get(index, 0)
+
+    def dot(self, other):
+        """Compute dot product with another sparse vector."""
+        result = 0
+        # Iterate over the smaller vector for efficiency
+        if len(self.values) <= len(other.values):
+            for idx, val in self.values.items():
+                result += val * other.get(idx)
+        else:
+            for idx, val in other.values.items():
+                result += val * self.get(idx)
+        return result
+
+    def norm(self):
+        """Compute L2 norm."""
+        return math.sqrt(sum(v * v for v in self.values.values()))
+
+    def normalize(self):
+        """Normalize to unit length."""
+        n = self.norm()
+        if n > 0:
+            for idx in list(self.values.keys()):
+                self.values[idx] /= n
+
+class TextVectorizer:
+    """TF-IDF vectorization for text data."""
+
+    def __init__(self, max_features=300, min_df=2):
+        self.max_features = max_features
+        self.min_df = min_df
+        self.vocabulary = {}
+        self.idf_weights = {}
+        self.stop_words = {
+            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+            'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'be',
+            'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will',
+            'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this',
+            'that', 'these', 'those', 'very', 'just', 'only'
+        }
+
+    def _tokenize(self, text):
+        """Extract tokens and bigrams from text."""
+        if not text:
+            return []
+
+        # Clean text
+        text = re.sub(r'<[^>]+>', ' ', text.lower())
+        text = re.sub(r'[^a-z0-9\s\-_]', ' ', text)
+
+        # Get tokens
+        tokens = [t for t in text.split() if t and t not in self.stop_words and len(t) > 2]
+
+        # Add bigrams
+        bigrams = []
+        for i in range(len(tokens) - 1):
+            bigram = f"{tokens[i]} {tokens[i+1]}"
+            bigrams.append(bigram)
+
+        return tokens + bigrams
+
+    def fit_transform(self, texts):
+        """Fit the model and transform texts to vectors."""
+        # First pass: count document frequencies
+        doc_freq = defaultdict(int)
+        term_counts = Counter()
+        all_doc_terms = []
+
+        for text in texts:
+            terms = self._tokenize(text)
+            all_doc_terms.append(terms)
+            unique_terms = set(terms)
+
+            for term in unique_terms:
+                doc_freq[term] += 1
+            term_counts.update(terms)
+
+        # Kept so an incremental build can update them instead of re-tokenizing
+        self.doc_freq = doc_freq
+        self.term_counts = term_counts
+        self.documents = all_doc_terms
+
+        # Build vocabulary
+        selected_terms = self.select_terms(doc_freq, term_counts)
+        self.vocabulary = {term: idx for idx, term in enumerate(selected_terms)}
+
+        # Calculate IDF weights
+        n_docs = len(texts)
+        for term, idx in self.vocabulary.items():
+            # Add 1 for smoothing
+            self.idf_weights[idx] = math.log((n_docs + 1) / (doc_freq[term] + 1)) + 1
+
+        # Second pass: create vectors
+        return [self.transform_terms(terms) for terms in all_doc_terms]
+
+    def select_terms(self, doc_freq, term_counts):
+        """Features: the most frequent terms that appear in at least min_df docs."""
+        eligible_terms = [
+            term for term, count in term_counts.items()
+            if doc_freq.get(term, 0) >= self.min_df
+        ]
+
+        # Sort by frequency and take top features
+        eligible_terms.sort(key=lambda t: term_counts[t], reverse=True)
+        return eligible_terms[:self.max_features]
+
+    def transform_terms(self, terms):
+        """TF-IDF vector of one tokenized document, using the fitted vocabulary."""
+        vec = SparseVector(len(self.vocabulary))
+
+        # Calculate term frequencies
+        term_freq = Counter(terms)
+        total_terms = len(terms)
+
+        # Build TF-IDF vector
+        for term, freq in term_freq.items():
+            if term in self.vocabulary:
+                idx = self.vocabulary[term]
+                tf = freq / total_terms if total_terms > 0 else 0
+                vec.set(idx, tf * self.idf_weights[idx])
+
+        vec.normalize()
+        return vec
+
+class TagVectorizer:
+    """Vectorization for categorical tag data."""
 
-def compute_recommendations(data, max_recommendations=4):
-    """
-    Multi-modal content-based recommendation system.
-    Combines text similarity, tag similarity, and temporal proximity.
-    """
-    
-    class SparseVector:
-        """Efficient sparse vector representation."""
-        
-        def __init__(self, dimension):
-            self.dimension = dimension
-            self.values = {}  # Only store non-zero values
-            
-        def set(self, index, value):
-            if value != 0:
-                self.values[index] = value
-            elif index in self.values:
-                del self.values[index]
-                
-        def get(self, index):
-            return self.values.get(index, 0)
-        
-        def dot(self, other):
-            """Compute dot product with another sparse vector."""
-            result = 0
-            # Iterate over the smaller vector for efficiency
-            if len(self.values) <= len(other.values):
-                for idx, val in self.values.items():
-                    result += val * other.get(idx)
-            else:
-                for idx, val in other.values.items():
-                    result += val * self.get(idx)
-            return result
-        
-        def norm(self):
-            """Compute L2 norm."""
-            return math.sqrt(sum(v * v for v in self.values.values()))
-        
-        def normalize(self):
-            """Normalize to unit length."""
-            n = self.norm()
-            if n > 0:
-                for idx in list(self.values.keys()):
-                    self.values[idx] /= n
-    
-    class TextVectorizer:
-        """TF-IDF vectorization for text data."""
-        
-        def __init__(self, max_features=300, min_df=2):
-            self.max_features = max_features
-            self.min_df = min_df
-            self.vocabulary = {}
-            self.idf_weights = {}
-            self.stop_words = {
-                'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
-                'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'be',
-                'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will',
-                'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this',
-                'that', 'these', 'those', 'very', 'just', 'only'
-            }
-            
-        def _tokenize(self, text):
-            """Extract tokens and bigrams from text."""
-            if not text:
-                return []
-            
-            # Clean text
-            text = re.sub(r'<[^>]+>', ' ', text.lower())
-            text = re.sub(r'[^a-z0-9\s\-_]', ' ', text)
-            
-            # Get tokens
-            tokens = [t for t in text.split() if t and t not in self.stop_words and len(t) > 2]
-            
-            # Add bigrams
-            bigrams = []
-            for i in range(len(tokens) - 1):
-                bigram = f"{tokens[i]} {tokens[i+1]}"
-                bigrams.append(bigram)
-            
-            return tokens + bigrams
-        
-        def fit_transform(self, texts):
-            """Fit the model and transform texts to vectors."""
-            # First pass: count document frequencies
-            doc_freq = defaultdict(int)
-            term_counts = Counter()
-            all_doc_terms = []
-            
-            for text in texts:
-                terms = self._tokenize(text)
-                all_doc_terms.append(terms)
-                unique_terms = set(terms)
-                
-                for term in unique_terms:
-                    doc_freq[term] += 1
-                term_counts.update(terms)
-            
-            # Select features: frequent terms that appear in multiple docs
-            eligible_terms = [
-                term for term, count in term_counts.items()
-                if doc_freq[term] >= self.min_df
-            ]
-            
-            # Sort by frequency and take top features
-            eligible_terms.sort(key=lambda t: term_counts[t], reverse=True)
-            selected_terms = eligible_terms[:self.max_features]
-            
-            # Build vocabulary
-            self.vocabulary = {term: idx for idx, term in enumerate(selected_terms)}
-            
-            # Calculate IDF weights
-            n_docs = len(texts)
-            for term, idx in self.vocabulary.items():
-                # Add 1 for smoothing
-                self.idf_weights[idx] = math.log((n_docs + 1) / (doc_freq[term] + 1)) + 1
-            
-            # Second pass: create vectors
-            vectors = []
-            for terms in all_doc_terms:
-                vec = SparseVector(len(self.vocabulary))
-                
-                # Calculate term frequencies
-                term_freq = Counter(terms)
-                total_terms = len(terms)
-                
-                # Build TF-IDF vector
-                for term, freq in term_freq.items():
-                    if term in self.vocabulary:
-                        idx = self.vocabulary[term]
-                        tf = freq / total_terms if total_terms > 0 else 0
-                        vec.set(idx, tf * self.idf_weights[idx])
-                
-                vec.normalize()
-                vectors.append(vec)
-            
-            return vectors
-    
-    class TagVectorizer:
-        """Vectorization for categorical tag data."""
-        
-        def __init__(self):
-            self.vocabulary = {}
-            self.idf_weights = {}
-            
-        def fit_transform(self, tag_lists):
-            """Fit the model and transform tags to vectors."""
-            # Count document frequencies
-            doc_freq = defaultdict(int)
-            all_tags = []
-            
-            for tags in tag_lists:
-                # Normalize tags
-                normalized_tags = [t.strip().lower().replace('-', '').replace('_', '') 
-                                 for t in tags if t.strip()]
-                all_tags.append(normalized_tags)
-                
-                unique_tags = set(normalized_tags)
-                for tag in unique_tags:
-                    doc_freq[tag] += 1
-            
-            # Build vocabulary
-            unique_tags = list(set(sum(all_tags, [])))
-            self.vocabulary = {tag: idx for idx, tag in enumerate(unique_tags)}
-            
-            # Calculate IDF weights
-            n_docs = len(tag_lists)
-            for tag, idx in self.vocabulary.items():
-                self.idf_weights[idx] = math.log((n_docs + 1) / (doc_freq[tag] + 1)) + 1
-            
-            # Create vectors
-            vectors = []
-            for tags in all_tags:
-                vec = SparseVector(len(self.vocabulary))
-                
-                for tag in tags:
-                    if tag in self.vocabulary:
-                        idx = self.vocabulary[tag]
-                        vec.set(idx, self.idf_weights[idx])
-                
-                vec.normalize()
-                vectors.append(vec)
-            
-            return vectors
-    
-    def cosine_similarity(vec1, vec2):
-        """Compute cosine similarity between normalized vectors."""
-        return vec1.dot(vec2)
-    
-    def gaussian_kernel(diff, sigma=2.0):
-        """Gaussian similarity for temporal proximity."""
-        return math.exp(-(diff ** 2) / (2 * sigma ** 2))
-    
-    # Filter valid entries
-    valid_entries = []
-    entry_map = {}
-    
-    for entry in data:
-        if entry.get('id') and (entry.get('title') or entry.get('description')):
-            idx = len(valid_entries)
-            valid_entries.append(entry)
-            entry_map[entry['id']] = idx
-    
-    if not valid_entries:
-        return data
-    
-    print(f"Processing {len(valid_entries)} entries...")
-    
-    # Prepare data for vectorization
+    def __init__(self):
+        self.vocabulary = {}
+        self.idf_weights = {}
+
+    def fit_transform(self, tag_lists):
+        """Fit the model and transform tags to vectors."""
+        # Count document frequencies
+        doc_freq = defaultdict(int)
+        all_tags = []
+
+        for tags in tag_lists:
+            # Normalize tags
+            normalized_tags = self.normalize(tags)
+            all_tags.append(normalized_tags)
+
+            unique_tags = set(normalized_tags)
+            for tag in unique_tags:
+                doc_freq[tag] += 1
+
+        self.doc_freq = doc_freq
+        self.documents = all_tags
+
+        # Build vocabulary
+        unique_tags = list(set(sum(all_tags, [])))
+        self.vocabulary = {tag: idx for idx, tag in enumerate(unique_tags)}
+
+        # Calculate IDF weights
+        n_docs = len(tag_lists)
+        for tag, idx in self.vocabulary.items():
+            self.idf_weights[idx] = math.log((n_docs + 1) / (doc_freq[tag] + 1)) + 1
+
+        # Create vectors
+        return [self.transform_tags(tags) for tags in all_tags]
+
+    @staticmethod
+    def normalize(tags):
+        return [t.strip().lower().replace('-', '').replace('_', '')
+                for t in tags if t.strip()]
+
+    def transform_tags(self, tags):
+        """Vector of one normalized tag list, using the fitted vocabulary."""
+        vec = SparseVector(len(self.vocabulary))
+
+        for tag in tags:
+            if tag in self.vocabulary:
+                idx = self.vocabulary[tag]
+                vec.set(idx, self.idf_weights[idx])
+
+        vec.normalize()
+        return vec
+
+def gaussian_kernel(diff, sigma=2.0):
+    """Gaussian similarity for temporal proximity."""
+    return math.exp(-(diff ** 2) / (2 * sigma ** 2))
+
+TEMPORAL_SIGMA = 3.0
+# Year distance assumed when either entry has no year
+UNKNOWN_YEAR_DIFF = 5
+RECOMMENDATION_ENGINES = ('auto', 'python', 'numpy', 'index')
+
+def adaptive_weights(text_sim, tag_sim):
+    """(content_weight, text_weight) for one pair of entries."""
+    if text_sim > 0.6:
+        # Strong text match
+        return 0.8, 0.75
+    elif text_sim > 0.3:
+        # Moderate text match
+        return 0.85, 0.6
+    elif tag_sim > 0.5:
+        # Strong tag match, weak text
+        return 0.9, 0.3
+    # Default weights
+    return 0.9, 0.5
+
+def recommendation_features(valid_entries):
+    """Text, tag and year inputs of the engines, one row per entry."""
     texts = []
     tag_lists = []
     years = []
-    
+
     for entry in valid_entries:
         # Combine title and description
         title = entry.get('title', '')
@@ -1000,82 +2389,572 @@ def compute_recommendations(data, max_recommendations=4):
         # Weight title more heavily
         combined_text = f"{title} {title} {title} {description}"
         texts.append(combined_text)
-        
+
         # Extract tags
         tags_str = entry.get('tags', '')
         tags = [t.strip() for t in tags_str.split(',') if t.strip()]
         tag_lists.append(tags)
-        
+
         # Extract year
         year_str = str(entry.get('year', '0'))
         years.append(int(year_str) if year_str.isdigit() else 0)
-    
-    # Vectorize text and tags
-    print("Building text vectors...")
-    text_vectorizer = TextVectorizer(max_features=300, min_df=1)
-    text_vectors = text_vectorizer.fit_transform(texts)
-    
-    print("Building tag vectors...")
-    tag_vectorizer = TagVectorizer()
-    tag_vectors = tag_vectorizer.fit_transform(tag_lists)
-    
-    # Compute recommendations
-    print("Computing similarities...")
-    recommendations = {}
-    
-    for i, entry in enumerate(valid_entries):
+    return texts, tag_lists, years
+
+def recommend_python(text_vectors, tag_vectors, years, locked, max_recommendations,
+                     rows=None, with_scores=False):
+    """Reference engine: scores every pair in Python. Returns, per row, the
+    row indices of its top recommendations ((index, score) pairs with
+    with_scores). Only `rows` are scored when given."""
+    top = []
+    for i in (range(len(text_vectors)) if rows is None else rows):
         similarities = []
-        
-        for j, other_entry in enumerate(valid_entries):
+
+        for j in range(len(text_vectors)):
             if i == j:
                 continue
-            
+
             # Skip locked entries
-            if other_entry.get('locked', False):
+            if locked[j]:
                 continue
-            
-            # Compute text similarity
-            text_sim = cosine_similarity(text_vectors[i], text_vectors[j])
-            
+
+            # Compute text similarity (vectors are normalized, so dot = cosine)
+            text_sim = text_vectors[i].dot(text_vectors[j])
+
             # Compute tag similarity
-            tag_sim = cosine_similarity(tag_vectors[i], tag_vectors[j])
-            
+            tag_sim = tag_vectors[i].dot(tag_vectors[j])
+
             # Compute temporal similarity
-            year_diff = abs(years[i] - years[j]) if years[i] and years[j] else 5
-            temporal_sim = gaussian_kernel(year_diff, sigma=3.0)
-            
+            year_diff = abs(years[i] - years[j]) if years[i] and years[j] else UNKNOWN_YEAR_DIFF
+            temporal_sim = gaussian_kernel(year_diff, sigma=TEMPORAL_SIGMA)
+
             # Adaptive weighting
-            if text_sim > 0.6:
-                # Strong text match
-                content_weight = 0.8
-                text_weight = 0.75
-            elif text_sim > 0.3:
-                # Moderate text match
-                content_weight = 0.85
-                text_weight = 0.6
-            elif tag_sim > 0.5:
-                # Strong tag match, weak text
-                content_weight = 0.9
-                text_weight = 0.3
-            else:
-                # Default weights
-                content_weight = 0.9
-                text_weight = 0.5
-            
+            content_weight, text_weight = adaptive_weights(text_sim, tag_sim)
+
             # Combine similarities
             tag_weight = 1 - text_weight
             content_sim = text_weight * text_sim + tag_weight * tag_sim
             temporal_weight = 1 - content_weight
-            
+
             final_score = content_weight * content_sim + temporal_weight * temporal_sim
-            
+
             if final_score > 0:
-                similarities.append((j, final_score, text_sim, tag_sim))
-        
+                similarities.append((j, final_score))
+
         # Sort and get top recommendations
         similarities.sort(key=lambda x: x[1], reverse=True)
-        rec_ids = [valid_entries[idx]['id'] for idx, _, _, _ in similarities[:max_recommendations]]
-        recommendations[entry['id']] = rec_ids
+        best = similarities[:max_recommendations]
+        top.append(best if with_scores else [j for j, _ in best])
+    return top
+
+def sparse_rows(vectors, dimension):
+    """CSR matrix with one SparseVector per row (values copied exactly)."""
+    from scipy import sparse
+    indptr = [0]
+    indices = []
+    values = []
+    for vec in vectors:
+        indices.extend(vec.values.keys())
+        values.extend(vec.values.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix((values, indices, indptr), shape=(len(vectors), dimension), dtype=float)
+
+def combined_scores(text_sim, tag_sim, temporal_sim):
+    """Adaptive weighting of adaptive_weights() as array operations."""
+    import numpy as np
+    conditions = [text_sim > 0.6, text_sim > 0.3, tag_sim > 0.5]
+    content_weight = np.select(conditions, [0.8, 0.85, 0.9], 0.9)
+    text_weight = np.select(conditions, [0.75, 0.6, 0.3], 0.5)
+    content_sim = text_weight * text_sim + (1 - text_weight) * tag_sim
+    return content_weight * content_sim + (1 - content_weight) * temporal_sim
+
+def top_k_rows(scores, k):
+    """Per row of a score block, the column indices of the k best finite
+    scores, best first. Ties go to the lower column, as the stable sort of
+    the python engine does."""
+    import numpy as np
+    n = scores.shape[1]
+    k = min(k, n)
+    if k == 0:
+        return [[] for _ in range(len(scores))]
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    # argpartition picks arbitrarily among scores tied with the k-th best;
+    # those rows fall back to an exact per-row sort
+    kth = part_scores.min(axis=1)
+    tied = (scores >= kth[:, None]).sum(axis=1) > k
+    part.sort(axis=1)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+    best = np.take_along_axis(part, order, axis=1)
+    top = []
+    for r in range(len(scores)):
+        if tied[r] and np.isfinite(kth[r]):
+            candidates = np.flatnonzero(scores[r] >= kth[r])
+            candidates = candidates[np.argsort(-scores[r, candidates], kind='stable')][:k]
+        else:
+            candidates = best[r]
+        top.append([int(j) for j in candidates if np.isfinite(scores[r, j])])
+    return top
+
+def temporal_similarity(years_a, years_b):
+    """gaussian_kernel() of the year distance, elementwise over broadcast
+    year arrays. Distances are integers, so the kernel is looked up rather
+    than recomputed with np.exp and every value is bit-identical to the
+    python engine's."""
+    import numpy as np
+    year_diff = np.abs(years_a - years_b)
+    year_diff[(years_a == 0) | (years_b == 0)] = UNKNOWN_YEAR_DIFF
+    kernel = np.array([gaussian_kernel(d, sigma=TEMPORAL_SIGMA)
+                       for d in range(int(year_diff.max(initial=0)) + 1)])
+    return kernel[year_diff]
+
+def score_block(text_matrix, tag_matrix, years, locked, rows, cols=None, transposed=None):
+    """Dense final scores of `rows` against `cols` (default: every entry).
+    Self, locked and non-positive scores come back as -inf, since they are
+    never recommended."""
+    import numpy as np
+    if cols is None:
+        cols = np.arange(text_matrix.shape[0])
+    if transposed is None:
+        transposed = (text_matrix[cols].T.tocsc(), tag_matrix[cols].T.tocsc())
+    text_sim = (text_matrix[rows] @ transposed[0]).toarray()
+    tag_sim = (tag_matrix[rows] @ transposed[1]).toarray()
+    temporal_sim = temporal_similarity(years[rows, None], years[None, cols])
+    scores = combined_scores(text_sim, tag_sim, temporal_sim)
+    scores[(scores <= 0) | locked[None, cols] | (rows[:, None] == cols[None, :])] = -np.inf
+    return scores
+
+def recommend_numpy(text_vectors, tag_vectors, years, locked, max_recommendations,
+                    text_dim, tag_dim, rows=None, with_scores=False, block_cells=1 << 22):
+    """Vectorized engine: similarities come from sparse matrix products,
+    weighting, masks and top-k from array operations, a block of rows at a
+    time so memory stays at about block_cells scores. Only `rows` are
+    scored when given."""
+    import numpy as np
+
+    n = len(text_vectors)
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    text_matrix = sparse_rows(text_vectors, text_dim)
+    tag_matrix = sparse_rows(tag_vectors, tag_dim)
+    transposed = (text_matrix.T.tocsc(), tag_matrix.T.tocsc())
+    years = np.asarray(years, dtype=np.int64)
+    locked = np.asarray(locked, dtype=bool)
+
+    block = max(1, block_cells // max(n, 1))
+    top = []
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        scores = score_block(text_matrix, tag_matrix, years, locked, block_rows, transposed=transposed)
+        for r, best in enumerate(top_k_rows(scores, max_recommendations)):
+            top.append([(j, float(scores[r, j])) for j in best] if with_scores else best)
+    return top
+
+# Candidate generation for the 'index' engine. Each entry is only scored
+# against entries found through an inverted index over its text terms and
+# tags (posting lists keep their highest-weighted entries), plus the best
+# temporal-only matches for its year, which is all a zero-overlap entry can
+# score on. The candidate budget grows until recall on a sample of rows,
+# checked against the exact numpy engine, reaches the recall target.
+RECALL_TARGET = 0.95
+RECALL_SAMPLE_SIZE = 200
+INDEX_MIN_CANDIDATES = 32
+# Highest-weighted terms / tags of an entry that are looked up in the index
+INDEX_QUERY_TERMS = 16
+# 'auto' switches from the exact numpy engine to the index past this size
+INDEX_ENGINE_MIN_ENTRIES = 5000
+
+def truncated_postings(matrix, limit):
+    """Inverted index of a CSR matrix as a (features x entries) CSR matrix,
+    keeping only the `limit` highest weights of each posting list."""
+    import numpy as np
+    from scipy import sparse
+    postings = matrix.T.tocsr()
+    indptr = [0]
+    indices = []
+    data = []
+    for feature in range(postings.shape[0]):
+        start, end = postings.indptr[feature], postings.indptr[feature + 1]
+        keep = np.arange(start, end)
+        if end - start > limit:
+            keep = start + np.argpartition(-postings.data[start:end], limit - 1)[:limit]
+        indices.append(postings.indices[keep])
+        data.append(postings.data[keep])
+        indptr.append(indptr[-1] + len(keep))
+    if not data:
+        return sparse.csr_matrix(postings.shape)
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=postings.shape)
+
+def temporal_candidates(years, locked, k):
+    """For each distinct year, the k + 1 unlocked entries that score best
+    on temporal similarity alone (one spare for the entry itself)."""
+    import numpy as np
+    unlocked = np.flatnonzero(~locked)
+    best = {}
+    for year in np.unique(years):
+        temporal_sim = temporal_similarity(np.full(len(unlocked), year), years[unlocked])
+        order = np.argsort(-temporal_sim, kind='stable')[:k + 1]
+        best[int(year)] = unlocked[order]
+    return best
+
+def recommend_index(text_vectors, tag_vectors, years, locked, max_recommendations,
+                    text_dim, tag_dim, candidates=INDEX_MIN_CANDIDATES, rows=None,
+                    with_scores=False, block_pairs=1 << 18):
+    """Approximate engine: each row is scored exactly, but only against its
+    `candidates` best index matches plus its temporal candidates."""
+    import numpy as np
+
+    n = len(text_vectors)
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    text_matrix = sparse_rows(text_vectors, text_dim)
+    tag_matrix = sparse_rows(tag_vectors, tag_dim)
+    years = np.asarray(years, dtype=np.int64)
+    locked = np.asarray(locked, dtype=bool)
+    # Locked entries are never recommended, so they are left out of the index
+    keep = np.flatnonzero(~locked)
+    text_postings = truncated_postings(text_matrix[keep], 2 * candidates)
+    tag_postings = truncated_postings(tag_matrix[keep], 2 * candidates)
+    text_queries = truncated_postings(text_matrix.T, INDEX_QUERY_TERMS)
+    tag_queries = truncated_postings(tag_matrix.T, INDEX_QUERY_TERMS)
+    fill = temporal_candidates(years, locked, max_recommendations)
+
+    block = max(1, block_pairs // (candidates + max_recommendations + 1))
+    top = []
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        # Partial dot products over the truncated postings, default weights
+        partial = (0.5 * (text_queries[block_rows] @ text_postings)
+                   + 0.5 * (tag_queries[block_rows] @ tag_postings)).tocsr()
+        pair_rows = []
+        pair_cols = []
+        for r, row in enumerate(block_rows):
+            start_r, end_r = partial.indptr[r], partial.indptr[r + 1]
+            found = keep[partial.indices[start_r:end_r]]
+            if len(found) > candidates:
+                found = found[np.argpartition(-partial.data[start_r:end_r], candidates - 1)[:candidates]]
+            cols = np.union1d(found, fill[int(years[row])])
+            cols = cols[cols != row]
+            pair_rows.append(np.full(len(cols), r))
+            pair_cols.append(cols)
+        pair_rows = np.concatenate(pair_rows)
+        pair_cols = np.concatenate(pair_cols)
+        # Exact scores of the candidate pairs
+        text_sim = np.asarray(text_matrix[block_rows[pair_rows]].multiply(text_matrix[pair_cols]).sum(axis=1)).ravel()
+        tag_sim = np.asarray(tag_matrix[block_rows[pair_rows]].multiply(tag_matrix[pair_cols]).sum(axis=1)).ravel()
+        temporal_sim = temporal_similarity(years[block_rows[pair_rows]], years[pair_cols])
+        scores = combined_scores(text_sim, tag_sim, temporal_sim)
+        # Best first within each row, ties to the lower column
+        order = np.lexsort((pair_cols, -scores, pair_rows))
+        pair_rows, pair_cols, scores = pair_rows[order], pair_cols[order], scores[order]
+        bounds = np.searchsorted(pair_rows, np.arange(len(block_rows) + 1))
+        for r in range(len(block_rows)):
+            cols, row_scores = pair_cols[bounds[r]:bounds[r + 1]], scores[bounds[r]:bounds[r + 1]]
+            keep_r = row_scores > 0
+            best = zip(cols[keep_r][:max_recommendations].tolist(), row_scores[keep_r][:max_recommendations].tolist())
+            top.append(list(best) if with_scores else [j for j, _ in best])
+    return top
+
+def recommendation_recall(approximate, exact):
+    """Share of the exact recommendations the approximate engine found."""
+    found = sum(len(set(a) & set(e)) for a, e in zip(approximate, exact))
+    total = sum(len(e) for e in exact)
+    return found / total if total else 1.0
+
+def tune_index_candidates(text_vectors, tag_vectors, years, locked, max_recommendations,
+                          text_dim, tag_dim, recall_target=RECALL_TARGET):
+    """Smallest candidate budget (doubling from INDEX_MIN_CANDIDATES) whose
+    recall on a sample of rows reaches recall_target, with that recall."""
+    import numpy as np
+    n = len(text_vectors)
+    sample = np.unique(np.linspace(0, n - 1, min(n, RECALL_SAMPLE_SIZE)).astype(np.int64))
+    args = (text_vectors, tag_vectors, years, locked, max_recommendations, text_dim, tag_dim)
+    exact = recommend_numpy(*args, rows=sample)
+    candidates = INDEX_MIN_CANDIDATES
+    while True:
+        recall = recommendation_recall(recommend_index(*args, candidates=candidates, rows=sample), exact)
+        if recall >= recall_target or candidates >= n:
+            return candidates, recall
+        candidates *= 2
+
+# Incremental recommendations: the tokenized documents, frequencies, frozen
+# vocabularies and ranked candidates (top k + RECOMMEND_SLACK, with scores)
+# of the last build are persisted. The next build re-tokenizes and rescores
+# only added / edited entries, and merges their scores into everyone else's
+# ranked list. Vectors keep the frozen vocabulary and IDF until the
+# vocabulary a refit would pick drifts past VOCABULARY_DRIFT_THRESHOLD, then
+# everything is rebuilt.
+RECOMMEND_STATE_PATH = os.path.join('entries', 'compiled', '.recommend_state.json')
+RECOMMEND_SLACK = 4
+VOCABULARY_DRIFT_THRESHOLD = 0.05
+
+class RecommendationState:
+    """Persisted vectorizer state and ranked candidates of the last build."""
+
+    def __init__(self, path=RECOMMEND_STATE_PATH):
+        self.path = path
+        try:
+            with open(self.path, 'r') as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.state = {}
+
+    def usable(self, settings):
+        return bool(self.state) and self.state.get('settings') == settings
+
+    def save(self, state):
+        if state is self.state:
+            return
+        self.state = state
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            # dumps() runs the C encoder; dump() streams through the Python one
+            f.write(json.dumps(state))
+        os.replace(tmp_path, self.path)
+
+def document_signature(text, tags, year, locked):
+    return hashlib.md5(repr((text, tags, year, locked)).encode()).hexdigest()
+
+def _count_document(doc_freq, terms, sign, term_counts=None):
+    """Add (sign=1) or remove (sign=-1) one document's terms."""
+    for term in set(terms):
+        doc_freq[term] = doc_freq.get(term, 0) + sign
+        if doc_freq[term] <= 0:
+            del doc_freq[term]
+    if term_counts is not None:
+        for term, count in Counter(terms).items():
+            term_counts[term] = term_counts.get(term, 0) + sign * count
+            if term_counts[term] <= 0:
+                del term_counts[term]
+
+def incremental_recommendations(state, ids, signatures, texts, tag_lists, years, locked,
+                                max_recommendations, drift_threshold=VOCABULARY_DRIFT_THRESHOLD):
+    """
+    Bring the ranked lists of a previous build up to date. Returns (ranked
+    (index, score) lists per row, new state, text vocabulary, tag
+    vocabulary), or None when a full rebuild is needed.
+    """
+    import numpy as np
+
+    docs = state['docs']
+    settings = state['settings']
+    current = set(ids)
+    stale = {doc_id for doc_id in docs if doc_id not in current}
+    changed_rows = [r for r, doc_id in enumerate(ids)
+                    if doc_id not in docs or docs[doc_id]['signature'] != signatures[r]]
+    stale.update(ids[r] for r in changed_rows)
+    # Ties rank by catalog position, so surviving entries must keep their order
+    if [i for i in state['order'] if i in current] != [i for i in ids if i in docs]:
+        print("  Recommendations: catalog order changed")
+        return None
+    if not stale:
+        position = {doc_id: r for r, doc_id in enumerate(ids)}
+        ranked = [[(position[j], score) for j, score in docs[doc_id]['ranked']] for doc_id in ids]
+        print("  Recommendations: unchanged")
+        return ranked, state, state['text']['vocabulary'], state['tags']['vocabulary']
+
+    text_vectorizer = TextVectorizer(max_features=settings['max_features'], min_df=settings['min_df'])
+    tag_vectorizer = TagVectorizer()
+    doc_freq = dict(state['text']['doc_freq'])
+    term_counts = dict(state['text']['term_counts'])
+    tag_doc_freq = dict(state['tags']['doc_freq'])
+    for doc_id in stale:
+        if doc_id in docs:
+            _count_document(doc_freq, docs[doc_id]['terms'], -1, term_counts)
+            _count_document(tag_doc_freq, docs[doc_id]['tags'], -1)
+    terms = {}
+    tags = {}
+    for r in changed_rows:
+        terms[r] = text_vectorizer._tokenize(texts[r])
+        tags[r] = TagVectorizer.normalize(tag_lists[r])
+        _count_document(doc_freq, terms[r], 1, term_counts)
+        _count_document(tag_doc_freq, tags[r], 1)
+
+    # Share of the vocabularies a refit would use that the frozen ones lack
+    frozen_terms = state['text']['vocabulary']
+    refit_terms = text_vectorizer.select_terms(doc_freq, term_counts)
+    text_drift = len(set(refit_terms) - set(frozen_terms)) / max(len(refit_terms), 1)
+    frozen_tags = state['tags']['vocabulary']
+    tag_drift = len(set(tag_doc_freq) - set(frozen_tags)) / max(len(tag_doc_freq), 1)
+    drift = max(text_drift, tag_drift)
+    if drift > drift_threshold:
+        print(f"  Recommendations: vocabulary drift {drift:.3f} > {drift_threshold}")
+        return None
+
+    text_vectorizer.vocabulary = {term: idx for idx, term in enumerate(frozen_terms)}
+    text_vectorizer.idf_weights = dict(enumerate(state['text']['idf']))
+    tag_vectorizer.vocabulary = {tag: idx for idx, tag in enumerate(frozen_tags)}
+    tag_vectorizer.idf_weights = dict(enumerate(state['tags']['idf']))
+    doc_terms = [terms[r] if r in terms else docs[doc_id]['terms'] for r, doc_id in enumerate(ids)]
+    doc_tags = [tags[r] if r in tags else docs[doc_id]['tags'] for r, doc_id in enumerate(ids)]
+    text_matrix = sparse_rows([text_vectorizer.transform_terms(t) for t in doc_terms], len(frozen_terms))
+    tag_matrix = sparse_rows([tag_vectorizer.transform_tags(t) for t in doc_tags], len(frozen_tags))
+    years_array = np.asarray(years, dtype=np.int64)
+    locked_array = np.asarray(locked, dtype=bool)
+    keep = max_recommendations + settings['slack']
+    position = {doc_id: r for r, doc_id in enumerate(ids)}
+
+    # Unchanged rows: drop stale candidates, merge in scores against changed rows
+    ranked = [None] * len(ids)
+    rescore = list(changed_rows)
+    unchanged = np.array([r for r in range(len(ids)) if ids[r] not in stale], dtype=np.int64)
+    changed_cols = np.asarray(changed_rows, dtype=np.int64)
+    fresh_scores = (score_block(text_matrix, tag_matrix, years_array, locked_array, unchanged, changed_cols)
+                    if len(changed_cols) and len(unchanged) else None)
+    for u, row in enumerate(unchanged.tolist()):
+        stored = docs[ids[row]]['ranked']
+        survivors = [(position[j], score) for j, score in stored if j not in stale]
+        merged = survivors
+        if fresh_scores is not None:
+            finite = np.flatnonzero(np.isfinite(fresh_scores[u]))
+            merged = survivors + list(zip(changed_cols[finite].tolist(), fresh_scores[u, finite].tolist()))
+        merged.sort(key=lambda item: (-item[1], item[0]))
+        if len(stored) >= keep:
+            # The stored list was cut off: past its last survivor, unseen
+            # unchanged entries could outrank what is left
+            if not survivors:
+                rescore.append(row)
+                continue
+            bound = (-survivors[-1][1], survivors[-1][0])
+            merged = [item for item in merged if (-item[1], item[0]) <= bound]
+            if len(merged) < max_recommendations:
+                rescore.append(row)
+                continue
+        ranked[row] = merged[:keep]
+
+    # Added, edited and depleted rows are scored against every entry
+    rescore = np.asarray(sorted(rescore), dtype=np.int64)
+    transposed = (text_matrix.T.tocsc(), tag_matrix.T.tocsc())
+    block = max(1, (1 << 22) // len(ids))
+    for start in range(0, len(rescore), block):
+        block_rows = rescore[start:start + block]
+        scores = score_block(text_matrix, tag_matrix, years_array, locked_array, block_rows,
+                             transposed=transposed)
+        for b, best in enumerate(top_k_rows(scores, keep)):
+            ranked[block_rows[b]] = [(j, float(scores[b, j])) for j in best]
+    print(f"  Recommendations: {len(changed_rows)} changed, {len(stale) - len(changed_rows)} removed, "
+          f"{len(rescore)} rows rescored, drift {drift:.3f}")
+
+    new_state = dict(state, order=list(ids), docs={
+        doc_id: {'signature': signatures[r], 'terms': doc_terms[r], 'tags': doc_tags[r],
+                 'ranked': [[ids[j], score] for j, score in ranked[r]]}
+        for r, doc_id in enumerate(ids)})
+    new_state['text'] = dict(state['text'], doc_freq=doc_freq, term_counts=term_counts)
+    new_state['tags'] = dict(state['tags'], doc_freq=tag_doc_freq)
+    return ranked, new_state, frozen_terms, frozen_tags
+
+def fitted_state(settings, ids, signatures, ranked, text_vectorizer, tag_vectorizer):
+    """State of a full build, for the next incremental one."""
+    def frozen(vectorizer):
+        terms = sorted(vectorizer.vocabulary, key=vectorizer.vocabulary.get)
+        return terms, [vectorizer.idf_weights[vectorizer.vocabulary[t]] for t in terms]
+    text_terms, text_idf = frozen(text_vectorizer)
+    tag_terms, tag_idf = frozen(tag_vectorizer)
+    return {
+        'settings': settings,
+        'order': list(ids),
+        'text': {'vocabulary': text_terms, 'idf': text_idf,
+                 'doc_freq': dict(text_vectorizer.doc_freq), 'term_counts': dict(text_vectorizer.term_counts)},
+        'tags': {'vocabulary': tag_terms, 'idf': tag_idf, 'doc_freq': dict(tag_vectorizer.doc_freq)},
+        'docs': {doc_id: {'signature': signatures[r], 'terms': text_vectorizer.documents[r],
+                          'tags': tag_vectorizer.documents[r],
+                          'ranked': [[ids[j], score] for j, score in ranked[r]]}
+                 for r, doc_id in enumerate(ids)},
+    }
+
+def resolve_recommendation_engine(engine, n_entries):
+    if engine not in RECOMMENDATION_ENGINES:
+        raise ValueError(f"Unknown recommendation engine {engine!r}")
+    if engine != 'auto':
+        return engine
+    try:
+        import numpy, scipy.sparse  # noqa: F401
+    except ImportError:
+        return 'python'
+    return 'index' if n_entries >= INDEX_ENGINE_MIN_ENTRIES else 'numpy'
+
+def compute_recommendations(data, max_recommendations=4, engine='auto',
+                            recall_target=RECALL_TARGET, report_recall=False, incremental=True):
+    """
+    Multi-modal content-based recommendation system.
+    Combines text similarity, tag similarity, and temporal proximity.
+
+    The 'index' engine tunes its candidate budget to recall_target; with
+    report_recall it is also compared against the exact engine on every
+    entry. With incremental=True (numpy / index engines) only what changed
+    since the last build is rescored.
+    """
+    # Filter valid entries
+    valid_entries = []
+    entry_map = {}
+    
+    for entry in data:
+        if entry.get('id') and (entry.get('title') or entry.get('description')):
+            idx = len(valid_entries)
+            valid_entries.append(entry)
+            entry_map[entry['id']] = idx
+    
+    if not valid_entries:
+        return data
+    
+    print(f"Processing {len(valid_entries)} entries...")
+    
+    # Prepare data for vectorization
+    texts, tag_lists, years = recommendation_features(valid_entries)
+    locked = [bool(entry.get('locked', False)) for entry in valid_entries]
+    ids = [entry['id'] for entry in valid_entries]
+    engine = resolve_recommendation_engine(engine, len(valid_entries))
+
+    # Incremental update from the previous build's state
+    settings = {'max_features': 300, 'min_df': 1, 'max_recommendations': max_recommendations,
+                'slack': RECOMMEND_SLACK, 'engine': engine}
+    state = None
+    updated = None
+    if engine != 'python' and len(set(ids)) == len(ids):
+        state = RecommendationState()
+        signatures = [document_signature(*features)
+                      for features in zip(texts, tag_lists, years, locked)]
+        if incremental and state.usable(settings):
+            updated = incremental_recommendations(state.state, ids, signatures, texts, tag_lists,
+                                                  years, locked, max_recommendations)
+
+    if updated:
+        ranked, new_state, text_vocabulary, tag_vocabulary = updated
+        state.save(new_state)
+    else:
+        # Vectorize text and tags
+        print("Building text vectors...")
+        text_vectorizer = TextVectorizer(max_features=300, min_df=1)
+        text_vectors = text_vectorizer.fit_transform(texts)
+
+        print("Building tag vectors...")
+        tag_vectorizer = TagVectorizer()
+        tag_vectors = tag_vectorizer.fit_transform(tag_lists)
+
+        # Compute recommendations; the state keeps a few spare candidates
+        print(f"Computing similarities ({engine} engine)...")
+        keep = max_recommendations + (RECOMMEND_SLACK if state else 0)
+        args = (text_vectors, tag_vectors, years, locked, keep,
+                len(text_vectorizer.vocabulary), len(tag_vectorizer.vocabulary))
+        if engine == 'index':
+            candidates, sample_recall = tune_index_candidates(*args, recall_target=recall_target)
+            print(f"  Index: {candidates} candidates per entry, sampled recall {sample_recall:.3f}")
+            ranked = recommend_index(*args, candidates=candidates, with_scores=True)
+            if report_recall:
+                exact = recommend_numpy(*args[:4], max_recommendations, *args[5:])
+                top = [[j for j, _ in row[:max_recommendations]] for row in ranked]
+                recall = recommendation_recall(top, exact)
+                print(f"  Index recall against the exact engine: {recall:.4f}")
+        elif engine == 'numpy':
+            ranked = recommend_numpy(*args, with_scores=True)
+        else:
+            ranked = recommend_python(*args[:5], with_scores=True)
+        if state:
+            state.save(fitted_state(settings, ids, signatures, ranked, text_vectorizer, tag_vectorizer))
+        text_vocabulary = list(text_vectorizer.vocabulary)
+        tag_vocabulary = list(tag_vectorizer.vocabulary)
+
+    recommendations = {}
+    for entry, row in zip(valid_entries, ranked):
+        recommendations[entry['id']] = [valid_entries[j]['id'] for j, _ in row[:max_recommendations]]
     
     # Add recommendations to all entries
     for entry in data:
@@ -1084,11 +2963,11 @@ def compute_recommendations(data, max_recommendations=4):
     
     # Debug output
     print(f"\n=== Recommendation Summary ===")
-    print(f"Text vocabulary size: {len(text_vectorizer.vocabulary)}")
-    print(f"Tag vocabulary size: {len(tag_vectorizer.vocabulary)}")
+    print(f"Text vocabulary size: {len(text_vocabulary)}")
+    print(f"Tag vocabulary size: {len(tag_vocabulary)}")
     
     # Show some statistics
-    bigrams = [t for t in text_vectorizer.vocabulary.keys() if ' ' in t]
+    bigrams = [t for t in text_vocabulary if ' ' in t]
     if bigrams:
         print(f"Sample bigrams found: {bigrams[:5]}")
     
@@ -1105,84 +2984,1096 @@ def compute_recommendations(data, max_recommendations=4):
     
     return data
 
+def stored_recommendations(data, max_recommendations=4):
+    """Set recommended_ids from the ranked lists the last build saved,
+    without rescoring (and without NumPy). False when there are none."""
+    docs = RecommendationState().state.get('docs')
+    if not docs:
+        return False
+    ids = {entry['id'] for entry in data if entry.get('id')}
+    for entry in data:
+        ranked = docs.get(entry.get('id'), {}).get('ranked', [])
+        entry['recommended_ids'] = [doc_id for doc_id, _ in ranked if doc_id in ids][:max_recommendations]
+    return True
+
+# ---------------------------------------------------------------------------
+# Search index – an inverted index over title, description and tags, built
+# with the recommender's tokenizer and split into one small file per term
+# prefix so the client fetches only what a query needs:
+#   search/meta.json   {"version", "prefix_length", "ids": [entry ids],
+#                       "prefixes": [...]}
+#   search/<prefix>.json  {term: [[doc, weight], ...]}  best match first
+# where doc indexes meta.ids and weight is the term's L2-normalised TF-IDF
+# in that entry. A query term is looked up by its first prefix_length
+# characters, then matched exactly or as a prefix of the stored terms.
+# ---------------------------------------------------------------------------
+SEARCH_INDEX_DIR = os.path.join('entries', 'compiled', 'search')
+SEARCH_INDEX_VERSION = 1
+SEARCH_PREFIX_LENGTH = 2
+
+def write_if_changed(path, content):
+    """Atomically write content (str) to path unless it already holds it.
+    Returns True when the file was written."""
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+def search_postings(data):
+    """(ids, {term: [[doc, weight], ...]}) over every entry with an id."""
+    tokenizer = TextVectorizer()
+    ids = []
+    documents = []
+    for entry in data:
+        if not entry.get('id'):
+            continue
+        title = entry.get('title', '')
+        tags = entry.get('tags', '').replace(',', ' ')
+        # Title weighted like the recommender's text features
+        terms = tokenizer._tokenize(f"{title} {title} {title} {entry.get('description', '')} {tags}")
+        ids.append(entry['id'])
+        documents.append(Counter(t for t in terms if re.search(r'[a-z0-9]', t)))
+
+    doc_freq = Counter()
+    for counts in documents:
+        doc_freq.update(counts.keys())
+    n_docs = len(documents)
+    idf = {term: math.log((n_docs + 1) / (df + 1)) + 1 for term, df in doc_freq.items()}
+
+    postings = defaultdict(list)
+    for doc, counts in enumerate(documents):
+        total = sum(counts.values())
+        weights = {term: count / total * idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        for term, weight in weights.items():
+            postings[term].append([doc, round(weight / norm, 4)])
+    for term_postings in postings.values():
+        term_postings.sort(key=lambda p: (-p[1], p[0]))
+    return ids, postings
+
+def build_search_index(data, out_dir=SEARCH_INDEX_DIR, prefix_length=SEARCH_PREFIX_LENGTH):
+    """Write the per-prefix search index for data into out_dir, rewriting
+    only files whose content changed and removing prefixes that are gone.
+    Returns the paths of every index file."""
+    ids, postings = search_postings(data)
+    shards = defaultdict(dict)
+    for term in sorted(postings):
+        shards[term[:prefix_length]][term] = postings[term]
+
+    paths = []
+    written = 0
+    meta = {'version': SEARCH_INDEX_VERSION, 'prefix_length': prefix_length,
+            'ids': ids, 'prefixes': sorted(shards)}
+    meta_path = os.path.join(out_dir, 'meta.json')
+    written += write_if_changed(meta_path, json.dumps(meta, separators=(',', ':')))
+    paths.append(meta_path)
+    for prefix, terms in shards.items():
+        path = os.path.join(out_dir, f'{prefix}.json')
+        written += write_if_changed(path, json.dumps(terms, separators=(',', ':')))
+        paths.append(path)
+
+    keep = {os.path.basename(p) for p in paths}
+    removed = 0
+    for name in os.listdir(out_dir):
+        if name.endswith('.json') and name not in keep:
+            os.remove(os.path.join(out_dir, name))
+            removed += 1
+    print(f"  Search index: {len(postings)} terms in {len(shards)} prefix files "
+          f"({written} written, {removed} removed)")
+    return paths
+
+# ---------------------------------------------------------------------------
+# Page baking – bake.js renders the theme, filter and project pages from
+# compiled.json; this stage decides which of them an edit affects. The
+# entry -> page graph is read off the baked pages themselves: a page shows
+# every entry whose project page it links, and a project page shows its own
+# entry. That way it follows bake.js's category rules without repeating
+# them. .bake_graph.json keeps the graph and two fingerprints per entry.
+# When only what an entry displays changed, bake.js re-renders just the
+# pages it appears on; when something that decides where or in which order
+# it appears changed, or entries came or went, everything is baked.
+# A partial bake passes the page paths as arguments and is checked against
+# the pages on disk: a command that rewrites pages it wasn't given, or none
+# of those it was, doesn't take page arguments, and the build stops rather
+# than passing full bakes off as partial ones (--bake-full always bakes
+# everything).
+# ---------------------------------------------------------------------------
+BAKE_GRAPH_PATH = os.path.join('entries', 'compiled', '.bake_graph.json')
+BAKE_VERSION = 2
+BAKE_COMMAND = 'node bake.js'
+# What bake.js places and orders entries by; a change can move an entry
+# onto pages it isn't linked from yet
+BAKE_PLACEMENT_FIELDS = ('theme', 'tags', 'year', 'end_year', 'season', 'title', 'locked')
+# Folders under the site root that hold no baked pages
+BAKE_SKIP_DIRS = {'entries', 'static', 'public', 'node_modules'}
+PROJECT_LINK = re.compile(r'href="/\d{4}/([^"/#?]+)/?"')
+
+def bake_fingerprints(entry):
+    """(placement, content) hashes of an entry."""
+    placement = {field: entry.get(field) for field in BAKE_PLACEMENT_FIELDS}
+    return [hashlib.md5(json.dumps(placement, sort_keys=True).encode()).hexdigest(),
+            hashlib.md5(json.dumps(entry, sort_keys=True).encode()).hexdigest()]
+
+def scan_baked_pages(site_dir, paths=None):
+    """{page path: entry ids it shows} for the index.html pages under
+    site_dir, or only for `paths` (missing ones are left out)."""
+    if paths is None:
+        paths = []
+        for folder, dirs, files in os.walk(site_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.')
+                             and not (folder == site_dir and d in BAKE_SKIP_DIRS))
+            if 'index.html' in files:
+                paths.append(os.path.relpath(os.path.join(folder, 'index.html'), site_dir).replace(os.sep, '/'))
+    pages = {}
+    for path in paths:
+        try:
+            with open(os.path.join(site_dir, path), encoding='utf-8') as f:
+                shown = set(PROJECT_LINK.findall(f.read()))
+        except FileNotFoundError:
+            continue
+        parts = path.split('/')
+        if len(parts) == 3 and parts[0].isdigit():
+            shown.add(parts[1])   # <year>/<id>/index.html
+        pages[path] = sorted(shown)
+    return pages
+
+def stale_pages(data, graph, site_dir='.'):
+    """Pages to re-render for the entries that changed since `graph` was
+    baked, and tracked pages missing on disk: a sorted list, or None when
+    everything needs baking."""
+    fingerprints = {entry['id']: bake_fingerprints(entry) for entry in data if entry.get('id')}
+    old = graph.get('entries')
+    if not old or set(old) != set(fingerprints):
+        return None
+    if any(old[entry_id][0] != fp[0] for entry_id, fp in fingerprints.items()):
+        return None
+    changed = {entry_id for entry_id, fp in fingerprints.items() if old[entry_id][1] != fp[1]}
+    return sorted(path for path, shown in graph['pages'].items()
+                  if changed.intersection(shown) or not os.path.exists(os.path.join(site_dir, path)))
+
+def page_stats(site_dir, paths):
+    """{page path: (mtime_ns, inode, size)} for the pages on disk."""
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(os.path.join(site_dir, path))
+        except FileNotFoundError:
+            continue
+        stats[path] = (st.st_mtime_ns, st.st_ino, st.st_size)
+    return stats
+
+def bake_pages(data, site_dir='.', command=BAKE_COMMAND, graph_path=BAKE_GRAPH_PATH, partial=True):
+    """Run the bake command for the pages affected since the last bake (page
+    paths as arguments, none for a full bake; partial=False always bakes
+    everything). Returns the number of pages re-rendered, or None for a full
+    bake or a failed one. Raises SystemExit when the command turns out to
+    ignore its page arguments."""
+    import shlex
+
+    try:
+        with open(graph_path) as f:
+            graph = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        graph = {}
+    site_key = os.path.abspath(site_dir)
+    if graph.get('version') != BAKE_VERSION or graph.get('site_dir') != site_key:
+        graph = {}
+    pages = stale_pages(data, graph, site_dir) if partial else None
+    if pages == []:
+        print("  Baked pages: no entry changed, nothing to render")
+        return 0
+
+    argv = shlex.split(command) + (pages or [])
+    print(f"  Baking {'all pages' if pages is None else f'{len(pages)} pages'}: {command}")
+    before = page_stats(site_dir, graph['pages']) if pages is not None else {}
+    try:
+        subprocess.run(argv, cwd=site_dir, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        # The graph stays as it was, so the next build bakes these pages again
+        print(f"  ✗ Baking failed: {e}")
+        return None
+
+    if pages is not None:
+        after = page_stats(site_dir, graph['pages'])
+        others = [path for path in before if path not in pages and after.get(path) != before[path]]
+        written = [path for path in pages if path in after and after[path] != before.get(path)]
+        if others or not written:
+            # The graph stays as it was; nothing is recorded for this bake
+            raise SystemExit(
+                f"ERROR: '{command}' doesn't bake only the pages it is given: asked for "
+                f"{len(pages)}, it rewrote {len(written)} of them and {len(others)} others. "
+                f"Make it re-render just the page paths passed as arguments, or use --bake-full.")
+
+    if pages is None:
+        baked = scan_baked_pages(site_dir)
+    else:
+        baked = {path: shown for path, shown in graph['pages'].items() if path not in pages}
+        baked.update(scan_baked_pages(site_dir, pages))
+    graph = {'version': BAKE_VERSION, 'site_dir': site_key,
+             'entries': {entry['id']: bake_fingerprints(entry) for entry in data if entry.get('id')},
+             'pages': baked}
+    os.makedirs(os.path.dirname(graph_path) or '.', exist_ok=True)
+    tmp_path = graph_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(graph))
+    os.replace(tmp_path, graph_path)
+    print(f"  Baked pages: {len(baked)} pages tracked")
+    return None if pages is None else len(pages)
+
 import shutil
 from pathlib import Path
 
-def _needs_copy(src, dst):
-    """Return True only when dst is missing or differs from src."""
-    if not dst.exists():
-        return True
-    return os.path.getsize(src) != os.path.getsize(dst)
-
 def remove_leading_underscore_from_filename(file_path):
     path_parts = Path(file_path).parts
     new_filename = path_parts[-1].lstrip("_")
     return Path(*path_parts[:-1], new_filename)
 
-def copy_specific_folders(source, target, folder_names):
-    for folder_name in folder_names:
-        for path in source.rglob(f'*/{folder_name}'):
-            target_path = target / path.relative_to(source)
-            shutil.copytree(path, target_path, dirs_exist_ok=True)
+COMPILED_JSON_PATH = os.path.join('entries', 'compiled', 'compiled.json')
+
+# Compact schema (opt-in): each entry gets a 'base' folder, file_paths are
+# names relative to it, and 'dimensions' holds [w, h] (or
+# [w, h, [[name, format, w, h, bytes], ...]] with derivatives) aligned with
+# file_paths, so every path is stored once. media_dimensions keeps only the
+# paths outside file_paths (the thumbnail). A path containing '/' is
+# root-relative; a leading '/' marks a root path that has none. No
+# indentation. static/compact.js expands entries back to the full schema.
+def compact_path(path, base):
+    if base and path.startswith(base) and '/' not in path[len(base):]:
+        return path[len(base):]
+    return path if '/' in path else '/' + path
+
+def compact_dimensions(dims, base):
+    if not dims:
+        return None
+    packed = [dims['width'], dims['height']]
+    if dims.get('variants'):
+        packed.append([[compact_path(v['path'], base), v['format'], v['width'], v['height'], v['bytes']]
+                       for v in dims['variants']])
+    return packed
 
-def main():
-    t_start = time.time()
+def compact_entry(entry):
+    file_paths = entry.get('file_paths', [])
+    media_dimensions = entry.get('media_dimensions', {})
+    folders = [p.rsplit('/', 1)[0] for p in file_paths if '/' in p]
+    base = ''
+    if folders and len(folders) == len(file_paths):
+        common = os.path.commonpath(folders)
+        base = common + '/' if common else ''
+
+    compact = {key: value for key, value in entry.items()
+               if key not in ('file_paths', 'media_dimensions')}
+    compact['base'] = base
+    compact['file_paths'] = [compact_path(p, base) for p in file_paths]
+    compact['dimensions'] = [compact_dimensions(media_dimensions.get(p), base) for p in file_paths]
+    listed = set(file_paths)
+    extra = {compact_path(p, base): compact_dimensions(dims, base)
+             for p, dims in media_dimensions.items() if p not in listed}
+    if extra:
+        compact['media_dimensions'] = extra
+    return compact
+
+def dump_entries(entries, compact=False):
+    if compact:
+        return json.dumps([compact_entry(entry) for entry in entries], separators=(',', ':'))
+    return json.dumps(entries, indent=2)
+
+def write_compiled_json(data, path=COMPILED_JSON_PATH, compact=False):
+    with open(path, 'w') as json_file:
+        json_file.write(dump_entries(data, compact))
+
+# Sharded layout: manifest.json lists every entry with just what a listing
+# needs, the full entries live in shards/<key>.json (a list per shard)
+OUTPUT_LAYOUTS = ('single', 'sharded')
+SHARD_KEYS = ('entry', 'theme', 'year')
+SITE_MANIFEST_PATH = os.path.join('entries', 'compiled', 'manifest.json')
+SHARDS_DIR = os.path.join('entries', 'compiled', 'shards')
+SITE_MANIFEST_VERSION = 1
+
+def shard_key(entry, shard_by):
+    if shard_by == 'entry':
+        key = entry['id']
+    elif shard_by == 'theme':
+        key = entry.get('theme', '').split(',')[0].strip() or 'none'
+    else:
+        key = str(entry.get('year') or '0000')
+    return re.sub(r'[^a-z0-9_-]+', '-', key.lower())
+
+def write_sharded_json(data, shard_by='entry', manifest_path=SITE_MANIFEST_PATH,
+                       shards_dir=SHARDS_DIR, compact=False):
+    """Write the slim manifest and one detail shard per entry / theme / year,
+    rewriting only shards whose content changed. Returns every path written
+    or kept."""
+    shards = defaultdict(list)
+    listing = []
+    for entry in data:
+        if not entry.get('id'):
+            continue
+        key = shard_key(entry, shard_by)
+        shards[key].append(entry)
+        listing.append({
+            'id': entry['id'],
+            'title': entry.get('title', ''),
+            'year': entry.get('year', ''),
+            'theme': entry.get('theme', ''),
+            'thumbnail': entry.get('thumbnail_override', ''),
+            'locked': entry.get('locked', False),
+            'shard': f"shards/{key}.json",
+        })
+
+    paths = []
+    written = 0
+    for key, entries in shards.items():
+        path = os.path.join(shards_dir, f'{key}.json')
+        written += write_if_changed(path, dump_entries(entries, compact))
+        paths.append(path)
+
+    keep = {os.path.basename(p) for p in paths}
+    removed = 0
+    for name in os.listdir(shards_dir) if os.path.isdir(shards_dir) else []:
+        if name.endswith('.json') and name not in keep:
+            os.remove(os.path.join(shards_dir, name))
+            removed += 1
+
+    manifest = {'version': SITE_MANIFEST_VERSION, 'shard_by': shard_by, 'entries': listing}
+    write_if_changed(manifest_path, json.dumps(manifest, separators=(',', ':')) if compact
+                     else json.dumps(manifest, indent=2))
+    paths.append(manifest_path)
+    print(f"  Sharded output: {len(shards)} {shard_by} shards ({written} written, {removed} removed)")
+    return paths
+
+def generated_files(output_layout='single'):
+    """The generated files already on disk that are published alongside the
+    entries: the search index and, for the sharded layout, manifest.json
+    and its shards."""
+    dirs = [SEARCH_INDEX_DIR] + ([SHARDS_DIR] if output_layout == 'sharded' else [])
+    paths = [os.path.join(dir_path, name) for dir_path in dirs if os.path.isdir(dir_path)
+             for name in sorted(os.listdir(dir_path)) if name.endswith('.json')]
+    if output_layout == 'sharded' and os.path.exists(SITE_MANIFEST_PATH):
+        paths.append(SITE_MANIFEST_PATH)
+    return paths
 
-    validate_entries(data)
-    themes, existing_folders, entries_without_id, FileListForCopyingAtTheEnd = process_entries(data)
-    html_content = generate_html_content(themes)
+# ---------------------------------------------------------------------------
+# Publishing – a delta sync into the git directory. The source side is
+# hashed through media_cache.content_digest (stat-keyed, so unchanged files
+# are not re-read); .sync_manifest.json remembers the digest and target stat
+# of everything published, so a file is transferred only when its content
+# changed or the target copy was touched. Transfers run in parallel and try
+# a reflink (FICLONE), then copy_file_range, then a plain copy – or a
+# hardlink with mode='hardlink'. Files published earlier that are no longer
+# part of the site are deleted; nothing else in the target is touched.
+# ---------------------------------------------------------------------------
+DEFAULT_TARGET_DIR = os.environ.get('PORTFOLIO_GIT_DIR', '/home/colter/git/portfolio')
+SYNC_MANIFEST_PATH = os.path.join('entries', 'compiled', '.sync_manifest.json')
+SYNC_FOLDER_NAMES = ('html', 'pdf', 'compiled')
+SYNC_MODES = ('copy', 'hardlink')
+FICLONE = 0x40049409
+
+def sync_plan(file_lists, source_dir):
+    """{target path relative to the site root: source path} of everything
+    published: the site files, every listed entry file (leading underscores
+    dropped) and the contents of the entries' html / pdf / compiled folders."""
+    plan = {fp: source_dir / fp for fp in ['favicon.ico', 'compile.py']}
+    for file_path in (item for sublist in file_lists for item in sublist):
+        plan[remove_leading_underscore_from_filename(file_path).as_posix()] = source_dir / file_path
+
+    # One walk for all three folder kinds (entries/<...>/<name>, not entries/<name>)
+    entries_dir = source_dir / 'entries'
+    for dirpath, dirnames, filenames in os.walk(entries_dir):
+        if Path(dirpath) == entries_dir:
+            continue
+        for name in [d for d in dirnames if d in SYNC_FOLDER_NAMES]:
+            dirnames.remove(name)
+            for sub_dirpath, _, sub_filenames in os.walk(os.path.join(dirpath, name)):
+                for filename in sub_filenames:
+                    src = Path(sub_dirpath) / filename
+                    plan[src.relative_to(source_dir).as_posix()] = src
+    return plan
+
+def transfer_file(src, dst, mode='copy'):
+    """Replace dst with src atomically; returns the method that worked."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.sync"
+    if mode == 'hardlink':
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return 'hardlink'
+        except OSError:
+            pass  # other filesystem – copy instead
+    method = 'copy'
+    with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            method = 'reflink'
+        except (ImportError, OSError):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if sent == 0:
+                        break
+                    remaining -= sent
+                if remaining == 0:
+                    method = 'copy_file_range'
+            except (AttributeError, OSError):
+                pass
+            if method == 'copy':
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    shutil.copymode(src, tmp_path)
+    os.replace(tmp_path, dst)
+    return method
+
+@traced('sync_file', cat='publish')
+def sync_file(src, dst, previous, mode):
+    """Transfer src unless the manifest record shows dst already holds it.
+    Returns (record, method) – method is None when the file was skipped."""
+    digest = media_cache.content_digest(str(src))
+    if digest is None:
+        raise FileNotFoundError(2, 'No such file or directory', str(src))
+    try:
+        st = os.stat(dst)
+        if previous and previous[0] == digest and previous[1:] == [st.st_size, st.st_mtime_ns]:
+            return previous, None
+    except FileNotFoundError:
+        pass
+    method = transfer_file(src, dst, mode)
+    st = os.stat(dst)
+    return [digest, st.st_size, st.st_mtime_ns], method
+
+def copy_to_git(file_lists, source_dir, target_dir, jobs=1, mode='copy',
+                manifest_path=SYNC_MANIFEST_PATH, plan=None):
+    """Sync the published files (or an already computed sync_plan) into
+    target_dir. Returns (copied, skipped, removed)."""
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    if plan is None:
+        plan = sync_plan(file_lists, source_dir)
+    try:
+        with open(manifest_path) as f:
+            manifests = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifests = {}
+    target_key = str(target_dir.resolve())
+    previous = manifests.get(target_key, {})
+
+    records = {}
+    methods = Counter()
+    with MediaPool(jobs) as pool:
+        # File copies wait on the disk, not the GIL, so they use the thread pool
+        futures = [(rel, pool.submit_subprocess(sync_file, src, target_dir / rel, previous.get(rel), mode))
+                   for rel, src in plan.items()]
+        for rel, future in futures:
+            try:
+                records[rel], method = future.result()
+                methods[method] += 1
+            except Exception as e:
+                print(f"  ✗ Failed to publish {rel}: {e}")
+                if rel in previous:
+                    records[rel] = previous[rel]
 
-    with open('output.html', 'w') as file:
-        file.write(html_content)
+    removed = 0
+    for rel in set(previous) - set(plan):
+        try:
+            os.remove(target_dir / rel)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        folder = os.path.dirname(rel)
+        while folder:
+            try:
+                os.rmdir(target_dir / folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    manifests[target_key] = records
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(manifests))
+    os.replace(tmp_path, manifest_path)
+
+    skipped = methods.pop(None, 0)
+    copied = sum(methods.values())
+    if methods:
+        print("  Sync: " + ', '.join(f"{count} by {method}" for method, count in methods.most_common()))
+    return copied, skipped, removed
 
-    if entries_without_id:
-        print("\nEntries without defined id:")
-        for entry in entries_without_id:
-            print(entry['title'])
+# ---------------------------------------------------------------------------
+# Precompression – .gz / .br / .zst siblings of every published text
+# artifact, for servers that serve precompressed files (nginx gzip_static /
+# brotli_static, Caddy precompressed): the synced files, output.html,
+# compiled.json and the pages bake.js writes. The rest of the target
+# (node_modules, entry sources, ...) is left alone. Brotli and zstd need
+# the optional 'brotli' and 'zstandard' packages and are skipped without
+# them. A file is only recompressed when its content hash changed.
+# ---------------------------------------------------------------------------
+PRECOMPRESS_STATE_PATH = os.path.join('entries', 'compiled', '.precompress_state.json')
+PRECOMPRESS_EXTENSIONS = ('.html', '.json', '.xml', '.js', '.css', '.svg', '.txt')
+# What bake.js writes outside the folders it skips: pages, sitemap, robots.txt
+PRECOMPRESS_PAGE_EXTENSIONS = ('.html', '.xml', '.txt')
+PRECOMPRESS_LEVELS = {'gz': 9, 'br': 11, 'zst': 22}
+
+def available_compressors():
+    """{suffix: compress(bytes) -> bytes} for every installed codec."""
+    import gzip
+    compressors = {'gz': lambda b: gzip.compress(b, compresslevel=PRECOMPRESS_LEVELS['gz'], mtime=0)}
+    try:
+        import brotli
+        compressors['br'] = lambda b: brotli.compress(b, mode=brotli.MODE_TEXT,
+                                                      quality=PRECOMPRESS_LEVELS['br'])
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        compressors['zst'] = lambda b: zstandard.ZstdCompressor(level=PRECOMPRESS_LEVELS['zst']).compress(b)
+    except ImportError:
+        pass
+    return compressors
+
+@traced('precompress_file', cat='publish')
+def precompress_file(path, suffixes):
+    """Write path.<suffix> for each suffix atomically; returns bytes written."""
+    compressors = available_compressors()
+    with open(path, 'rb') as f:
+        content = f.read()
+    written = 0
+    for suffix in suffixes:
+        compressed = compressors[suffix](content)
+        tmp_path = f"{path}.{suffix}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, f"{path}.{suffix}")
+        written += len(compressed)
+    return written
+
+def precompress_candidates(root_dir, published=()):
+    """Sorted paths, relative to root_dir, of the published text artifacts
+    on disk: the text files among `published` (the sync plan), output.html,
+    compiled.json and the baked pages outside BAKE_SKIP_DIRS. Dot-files and
+    dot-folders are skipped."""
+    root_dir = os.fspath(root_dir)
+    prefix = os.path.join(root_dir, '')
+    candidates = set()
+    for rel in list(published) + ['output.html', COMPILED_JSON_PATH]:
+        rel = os.path.normpath(rel)
+        if (rel.lower().endswith(PRECOMPRESS_EXTENSIONS)
+                and not any(part.startswith('.') for part in rel.split(os.sep))
+                and os.path.isfile(os.path.join(root_dir, rel))):
+            candidates.add(rel)
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                       and not (dirpath == root_dir and d in BAKE_SKIP_DIRS)]
+        for name in filenames:
+            if not name.startswith('.') and name.lower().endswith(PRECOMPRESS_PAGE_EXTENSIONS):
+                # Walked from root_dir, so every dirpath starts with it
+                candidates.add(os.path.join(dirpath[len(prefix):], name))
+    return sorted(candidates)
+
+def precompress_tree(root_dir, jobs=1, state_path=PRECOMPRESS_STATE_PATH, published=()):
+    """Write compressed siblings for every changed published text artifact
+    under root_dir (see precompress_candidates; `published` is the sync
+    plan), in parallel, and drop the siblings of artifacts that are gone.
+    Files whose size and mtime match the last run aren't read again; the
+    rest are hashed, so a rewrite with the same content costs no
+    compression. Returns (compressed, unchanged)."""
+    suffixes = sorted(available_compressors())
+    missing = sorted(set(PRECOMPRESS_LEVELS) - set(suffixes))
+    if missing:
+        print(f"  Precompress: {', '.join(missing)} skipped (install brotli / zstandard)")
+    settings = {'version': 2, 'levels': PRECOMPRESS_LEVELS, 'suffixes': suffixes}
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    if state.get('settings') != settings:
+        state = {'settings': settings}
+    root_key = os.path.abspath(root_dir)
+    previous = state.get(root_key, {})
+
+    # rel path -> [size, mtime_ns, md5] of the source the siblings were made from
+    hashes = {}
+    todo = []
+    for rel in precompress_candidates(root_dir, published):
+        path = os.path.join(root_dir, rel)
+        st = os.stat(path)
+        old = previous.get(rel)
+        if old and old[:2] == [st.st_size, st.st_mtime_ns]:
+            digest = old[2]
+        else:
+            with open(path, 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()
+        hashes[rel] = [st.st_size, st.st_mtime_ns, digest]
+        if not old or old[2] != digest or not all(os.path.exists(f"{path}.{s}") for s in suffixes):
+            todo.append(path)
+
+    for rel in set(previous) - set(hashes):
+        for suffix in PRECOMPRESS_LEVELS:
+            try:
+                os.remove(os.path.join(root_dir, f"{rel}.{suffix}"))
+            except FileNotFoundError:
+                pass
+
+    total_bytes = 0
+    with MediaPool(jobs) as pool:
+        # CPU-bound like the PIL work, so it shares the process pool
+        futures = [(path, pool.submit_image(precompress_file, path, suffixes)) for path in todo]
+        for path, future in futures:
+            try:
+                total_bytes += future.result()
+            except Exception as e:
+                print(f"  ✗ Failed to precompress {path}: {e}")
+                hashes.pop(os.path.relpath(path, root_dir), None)
+
+    state[root_key] = hashes
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(state))
+    os.replace(tmp_path, state_path)
+    print(f"  Precompress: {len(todo)} files compressed ({total_bytes / 1024:.0f} KB), "
+          f"{len(hashes) - len(todo)} unchanged")
+    return len(todo), len(hashes) - len(todo)
+
+def write_site_outputs(data, themes, jobs=1, incremental=True, recommend_engine='auto',
+                       recall_target=RECALL_TARGET, report_recall=False, output_layout='single',
+                       shard_by='entry', compact=False, html_entry_data='inline', bake=False,
+                       bake_command=BAKE_COMMAND, bake_full=False, recommend=True, render=True):
+    """For an already processed catalog: recommendations and compiled.json
+    (or manifest + shards) when recommend, output.html, the search index and
+    (with bake) the affected bake.js pages, or all of them with bake_full,
+    when render. Returns the extra files to publish."""
+    extra_files = []
+    if recommend:
+        print("\nComputing project recommendations...")
+        with span('recommendations', engine=recommend_engine):
+            compute_recommendations(data, max_recommendations=4, engine=recommend_engine,
+                                    recall_target=recall_target, report_recall=report_recall,
+                                    incremental=incremental)
+
+        with span('json', layout=output_layout):
+            if output_layout == 'sharded':
+                print("Generating manifest.json and detail shards for the Node.js app...")
+                extra_files.append(write_sharded_json(data, shard_by=shard_by, compact=compact))
+                print("\u2705 manifest.json and shards created successfully.")
+            else:
+                print("Generating compiled.json for the Node.js app...")
+                write_compiled_json(data, compact=compact)
+                print("\u2705 compiled.json created successfully.")
+    elif render and bake and not stored_recommendations(data):
+        # Baked project pages link their related entries
+        compute_recommendations(data, max_recommendations=4, engine=recommend_engine,
+                                recall_target=recall_target, incremental=incremental)
+
+    if render:
+        with span('html'), open('output.html', 'w') as file:
+            write_html_content(themes, file, entry_data=html_entry_data)
+
+        print("Building search index...")
+        with span('search_index'):
+            extra_files.append(build_search_index(data))
+
+        if bake:
+            print("Baking pages...")
+            with span('bake'):
+                bake_pages(data, command=bake_command, partial=not bake_full)
+    return extra_files
+
+# ---------------------------------------------------------------------------
+# Watch mode – after the full build, follow entries/ with inotify (or stat
+# polling where inotify isn't available) and rebuild only the entries an
+# edit touches. A change under entries/<theme>/<id>/ dirties that entry; a
+# change to entries/<theme>.json is diffed against the loaded catalog. The
+# dirty slice goes through process_entries, then output.html, compiled.json,
+# recommendations (incrementally) and the search index are rewritten.
+# Syncing to the git directory is left to the next full build.
+# ---------------------------------------------------------------------------
+WATCH_DEBOUNCE = 0.15   # seconds of quiet before a batch of events is rebuilt
+WATCH_POLL_INTERVAL = 0.5
+
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_Q_OVERFLOW, IN_ISDIR = 0x4000, 0x40000000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                | IN_CREATE | IN_DELETE)
+INOTIFY_EVENT = struct.Struct('iIII')
+
+def watched_dirs(root):
+    """root and every directory below it except the build's own output."""
+    for dir_path, dir_names, _ in os.walk(root):
+        dir_names[:] = [d for d in dir_names if d != 'compiled']
+        yield dir_path
+
+class InotifyWatcher:
+    """Recursive inotify watch on root; read() returns changed paths, or
+    None when the kernel queue overflowed and anything may have changed."""
+
+    def __init__(self, root):
+        import ctypes
+
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        for dir_path in watched_dirs(root):
+            self._add(dir_path)
+
+    def _add(self, dir_path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), INOTIFY_MASK)
+        if wd >= 0:
+            self._dirs[wd] = dir_path
+
+    def wait(self, timeout=None):
+        import select
+
+        return bool(select.select([self.fd], [], [], timeout)[0])
+
+    def read(self):
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self._dirs:
+                continue
+            path = os.path.join(self._dirs[wd], os.fsdecode(name))
+            paths.add(path)
+            # New folders (a new entry, a moved-in media dir) get watched too,
+            # along with anything created in them before the watch existed
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.path.basename(path) != 'compiled':
+                for dir_path in watched_dirs(path):
+                    self._add(dir_path)
+                    paths.update(os.path.join(dir_path, f) for f in os.listdir(dir_path))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Fallback for systems without inotify: diffs a stat snapshot of root."""
+
+    def __init__(self, root, interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._changed = set()
+
+    def _scan(self):
+        snapshot = {}
+        for dir_path in watched_dirs(self.root):
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    try:
+                        st = dir_entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[dir_entry.path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            self._changed |= {path for path in snapshot.keys() | self._snapshot.keys()
+                              if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if self._changed:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval if deadline is None
+                       else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def read(self):
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def close(self):
+        pass
+
+def open_watcher(root):
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        print(f"  inotify unavailable ({e}), polling every {WATCH_POLL_INTERVAL}s")
+        return PollingWatcher(root)
+
+def next_change_batch(watcher, debounce=WATCH_DEBOUNCE):
+    """Block until something changes, then keep collecting until debounce
+    seconds pass without an event. None means rescan everything."""
+    watcher.wait()
+    paths = set()
+    while True:
+        changed = watcher.read()
+        if changed is None:
+            paths = None
+        elif paths is not None:
+            paths |= changed
+        if not watcher.wait(debounce):
+            return paths
+
+def entry_record(entry):
+    return {k: v for k, v in entry.items() if k not in COMPUTED_FIELDS}
+
+def changed_entries(paths, data, entries_dir='entries'):
+    """(catalog, dirty ids) for a batch of changed paths. The catalog is data
+    itself unless a JSON file changed, in which case it is reloaded and
+    entries whose record is unchanged keep their processed objects."""
+    folders = {entry_folder(entry, entries_dir): entry['id'] for entry in data if entry.get('id')}
+    dirty = set()
+    reload_json = paths is None
+    for path in paths or ():
+        parts = os.path.relpath(path, entries_dir).split(os.sep)
+        if parts[0] in ('compiled', '..'):
+            continue
+        if len(parts) == 1:
+            reload_json |= parts[0].endswith('.json') and parts[0] != 'life-events.json'
+        elif os.path.join(entries_dir, parts[0], parts[1]) in folders:
+            dirty.add(folders[os.path.join(entries_dir, parts[0], parts[1])])
+    if paths is None:
+        dirty.update(folders.values())
+    if not reload_json:
+        return data, dirty
+
+    previous = {entry['id']: entry for entry in data if entry.get('id')}
+    catalog = []
+    for entry in load_entries(entries_dir):
+        old = previous.get(entry.get('id'))
+        if old is not None and entry.get('id') not in dirty and entry_record(old) == entry_record(entry):
+            catalog.append(old)
+        else:
+            catalog.append(entry)
+            if entry.get('id'):
+                dirty.add(entry['id'])
+    return catalog, dirty
+
+def rebuild_changed(catalog, dirty, jobs=1, offline=False, youtube_base_url=YOUTUBE_THUMB_BASE_URL,
+                    **output_options):
+    """Reprocess the dirty entries of catalog and rewrite the site outputs."""
+    validate_entries(catalog)
+    ids = [entry['id'] for entry in catalog if entry.get('id')]
+    duplicates = {entry_id for entry_id, count in Counter(ids).items() if count > 1}
+    if duplicates:
+        print(f"  ✗ Duplicate ids {sorted(duplicates)}, fix them to resume rebuilding")
+        return False
+    if dirty:
+        process_entries([entry for entry in catalog if entry.get('id') in dirty], jobs=jobs,
+                        offline=offline, youtube_base_url=youtube_base_url, partial=True)
+    themes = group_by_theme(entry for entry in catalog if entry.get('id'))
+    write_site_outputs(catalog, themes, jobs=jobs, **output_options)
+    return True
+
+def watch_entries(data, entries_dir='entries', debounce=WATCH_DEBOUNCE, **build_options):
+    """Rebuild the entries touched by each batch of edits until interrupted.
+    A rebuild that fails (a half-copied image, say) is logged and leaves the
+    previous outputs in place; its entries stay dirty until the next edit."""
+    import traceback
+
+    watcher = open_watcher(entries_dir)
+    print(f"\nWatching {entries_dir}/ for changes (Ctrl+C to stop)...")
+    try:
+        while True:
+            paths = next_change_batch(watcher, debounce)
+            t_start = time.time()
+            dirty = set()
+            try:
+                catalog, dirty = changed_entries(paths, data, entries_dir)
+                # Drop entries the last rebuild already covers, e.g. the events
+                # caused by process_entries renaming or compressing their files
+                manifest = BuildManifest()
+                dirty = {entry['id'] for entry in catalog if entry.get('id') in dirty
+                         and not manifest.is_current(entry['id'], entry_fingerprint(entry, entry_folder(entry, entries_dir)))}
+                if not dirty and list(map(id, catalog)) == list(map(id, data)):
+                    continue
+                print(f"\n[watch] rebuilding {len(dirty)} entries: {', '.join(sorted(dirty)[:5])}"
+                      f"{' ...' if len(dirty) > 5 else ''}")
+                if rebuild_changed(catalog, dirty, **build_options):
+                    data[:] = catalog
+                    print(f"[watch] ✓ done in {time.time() - t_start:.2f}s")
+            except json.JSONDecodeError as e:
+                print(f"  ✗ Invalid JSON ({e}), waiting for the next save")
+            except SystemExit as e:
+                print(f"  ✗ {e}")
+            except Exception:
+                traceback.print_exc()
+                print(f"[watch] ✗ rebuilding {', '.join(sorted(dirty)) or 'the site outputs'} failed, "
+                      f"keeping the previous outputs; waiting for the next change")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+
+BUILD_COMMANDS = ('all', 'media', 'recommend', 'render', 'publish')
+
+def main(command='all', jobs=1, incremental=True, offline=False, youtube_base_url=YOUTUBE_THUMB_BASE_URL,
+         target_dir=DEFAULT_TARGET_DIR, sync_mode='copy', precompress=False, watch=False,
+         trace=None, trace_top=TRACE_TOP_N, **output_options):
+    """Run one build command; output_options go to write_site_outputs.
+
+    all does everything; media only processes media; recommend writes
+    recommendations and compiled.json; render writes output.html, the
+    search index and baked pages; publish syncs to the git directory.
+    Commands without media work take the media fields from the build
+    manifest. With trace, every stage and media call is timed into a
+    Chrome trace at that path.
+    """
+    t_start = time.time()
+    tracer.enabled = bool(trace)
 
-    print("\nComputing project recommendations...")
-    compute_recommendations(data, max_recommendations=4)
+    data = load_entries()
+    validate_entries(data)
+    if command in ('all', 'media') or not incremental:
+        with span('process_entries'):
+            themes, existing_folders, entries_without_id, FileListForCopyingAtTheEnd = process_entries(
+                data, jobs=jobs, incremental=incremental, offline=offline, youtube_base_url=youtube_base_url)
+
+        if entries_without_id:
+            print("\nEntries without defined id:")
+            for entry in entries_without_id:
+                print(entry['title'])
+    else:
+        with span('load_processed_entries'):
+            themes, FileListForCopyingAtTheEnd = load_processed_entries(
+                data, jobs=jobs, offline=offline, youtube_base_url=youtube_base_url)
 
-    print("Generating compiled.json for the Node.js app...")
-    with open('entries/compiled/compiled.json', 'w') as json_file:
-        json.dump(data, json_file, indent=2)
-    print("\u2705 compiled.json created successfully.")
+    if command in ('all', 'recommend', 'render'):
+        FileListForCopyingAtTheEnd += write_site_outputs(
+            data, themes, jobs=jobs, incremental=incremental, recommend=command != 'render',
+            render=command != 'recommend', **output_options)
 
     # Sitemap generation is now handled by bake.js
 
-    # --- Copy to git directory (skip unchanged files) ---
-    source_dir = Path(__file__).parent
-    target_dir = Path('/home/colter/git/portfolio')
-
-    print("copying over files to git")
-
-    for fp in ['favicon.ico', 'compile.py']:
-        src = source_dir / fp
-        dst = target_dir / fp
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        if _needs_copy(src, dst):
-            shutil.copy(src, dst)
-
-    all_copied_files = [item for sublist in FileListForCopyingAtTheEnd for item in sublist]
-    copied, skipped = 0, 0
-    for file_path in all_copied_files:
-        src = source_dir / file_path
-        new_file_path = remove_leading_underscore_from_filename(file_path)
-        dst = target_dir / new_file_path
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        if _needs_copy(src, dst):
-            shutil.copy(src, dst)
-            copied += 1
-        else:
-            skipped += 1
+    summary = ''
+    if command in ('all', 'publish'):
+        if command == 'publish':
+            FileListForCopyingAtTheEnd.append(generated_files(output_options.get('output_layout', 'single')))
 
-    entries_source_dir = source_dir / 'entries'
-    entries_target_dir = target_dir / 'entries'
-    copy_specific_folders(entries_source_dir, entries_target_dir, ['html', 'pdf', 'compiled'])
+        # --- Sync to the git directory (only changed files) ---
+        source_dir = Path(__file__).parent
+        target_dir = Path(target_dir)
+
+        print(f"syncing files to {target_dir}")
+        plan = sync_plan(FileListForCopyingAtTheEnd, source_dir)
+        with span('copy'):
+            copied, skipped, removed = copy_to_git(FileListForCopyingAtTheEnd, source_dir, target_dir,
+                                                   jobs=jobs, mode=sync_mode, plan=plan)
+        summary = f"  (copied {copied}, skipped {skipped} unchanged, removed {removed})"
+
+        if precompress:
+            print("precompressing text artifacts")
+            with span('precompress'):
+                precompress_tree(target_dir, jobs=jobs, published=plan)
 
     t_elapsed = time.time() - t_start
-    print(f"\n  compile.py finished in {t_elapsed:.1f}s  (copied {copied}, skipped {skipped} unchanged)")
+    label = 'compile.py' if command == 'all' else f'compile.py {command}'
+    print(f"\n  {label} finished in {t_elapsed:.1f}s{summary}")
+
+    if trace:
+        tracer.write(trace)
+        print(f"\nTrace: {len(tracer.events)} spans written to {trace}\n{tracer.summary(trace_top)}")
+        tracer.enabled = False
+
+    if watch:
+        watch_entries(data, jobs=jobs, offline=offline, youtube_base_url=youtube_base_url,
+                      **output_options)
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile portfolio entries into output.html and compiled.json.")
+    parser.add_argument('command', nargs='?', choices=BUILD_COMMANDS, default='all',
+                        help="all (default): the whole build; media: process media only; recommend: "
+                             "recommendations and compiled.json; render: output.html, search index and "
+                             "baked pages; publish: sync to the git directory")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="parallel media workers (0 = one per CPU core, default 1 = serial)")
+    parser.add_argument('--full', action='store_true',
+                        help="ignore the build manifest and reprocess every entry")
+    parser.add_argument('--derivative-widths', default=None,
+                        help="comma-separated widths of the responsive image ladder "
+                             f"(default {','.join(map(str, ENCODER_SETTINGS['derivative_widths']))}; empty disables)")
+    parser.add_argument('--derivative-formats', default=None,
+                        help="comma-separated formats of the responsive image ladder "
+                             "(e.g. webp,avif; default none, the ladder is opt-in)")
+    parser.add_argument('--offline', action='store_true',
+                        help="never touch the network; YouTube thumbnails not already on disk are skipped")
+    parser.add_argument('--youtube-base-url', default=YOUTUBE_THUMB_BASE_URL,
+                        help="where YouTube thumbnails are fetched from (e.g. a local stand-in server)")
+    parser.add_argument('--recommend-engine', choices=RECOMMENDATION_ENGINES, default='auto',
+                        help="recommendation scoring engine (default auto: numpy when NumPy/SciPy are "
+                             f"installed, index from {INDEX_ENGINE_MIN_ENTRIES} entries)")
+    parser.add_argument('--recall-target', type=float, default=RECALL_TARGET,
+                        help=f"recall the index engine tunes its candidate budget to (default {RECALL_TARGET})")
+    parser.add_argument('--report-recall', action='store_true',
+                        help="also run the exact engine and report the index engine's recall against it")
+    parser.add_argument('--output-layout', choices=OUTPUT_LAYOUTS, default='single',
+                        help="single compiled.json (default) or a slim manifest.json plus detail shards")
+    parser.add_argument('--shard-by', choices=SHARD_KEYS, default='entry',
+                        help="what one detail shard holds with --output-layout sharded (default entry)")
+    parser.add_argument('--compact', action='store_true',
+                        help="write the compact schema (per-entry base, [w, h] dimensions, no indentation; "
+                             "read it through static/compact.js)")
+    parser.add_argument('--precompress', action='store_true',
+                        help="after copying, write .gz/.br/.zst siblings of changed text artifacts "
+                             "in the git directory")
+    parser.add_argument('--html-entry-data', choices=HTML_ENTRY_DATA, default='inline',
+                        help="embed each entry's JSON in output.html (inline, default) or only its id")
+    parser.add_argument('--bake', action='store_true',
+                        help="re-render the baked theme, filter and project pages the changed entries "
+                             "appear on (all of them when placement changed)")
+    parser.add_argument('--bake-full', action='store_true',
+                        help="with --bake, always re-render every page (for a bake command that "
+                             "doesn't take page paths)")
+    parser.add_argument('--bake-command', default=BAKE_COMMAND,
+                        help="page renderer --bake runs, given the page paths to re-render "
+                             f"(default '{BAKE_COMMAND}')")
+    parser.add_argument('--target', default=DEFAULT_TARGET_DIR,
+                        help=f"git directory the site is published to (default $PORTFOLIO_GIT_DIR or {DEFAULT_TARGET_DIR})")
+    parser.add_argument('--sync-mode', choices=SYNC_MODES, default='copy',
+                        help="copy (reflink / copy_file_range where supported, default) or hardlink files into the target")
+    parser.add_argument('--trace', metavar='OUT.json', default=None,
+                        help="time every stage and media call into a Chrome trace file "
+                             "(chrome://tracing, ui.perfetto.dev) and print the slowest operations")
+    parser.add_argument('--trace-top', type=int, default=TRACE_TOP_N,
+                        help=f"how many operations the --trace summary lists (default {TRACE_TOP_N})")
+    parser.add_argument('--watch', action='store_true',
+                        help="after the build, watch entries/ and rebuild only the entries an edit touches")
+    args = parser.parse_args()
+    if args.watch and args.command != 'all':
+        parser.error("--watch only works with the 'all' command")
+    if args.derivative_widths is not None:
+        ENCODER_SETTINGS['derivative_widths'] = [int(w) for w in args.derivative_widths.split(',') if w.strip()]
+    if args.derivative_formats is not None:
+        ENCODER_SETTINGS['derivative_formats'] = [f.strip().lower() for f in args.derivative_formats.split(',') if f.strip()]
+    main(command=args.command, jobs=args.jobs or os.cpu_count() or 1, incremental=not args.full,
+         offline=args.offline, youtube_base_url=args.youtube_base_url,
+         recommend_engine=args.recommend_engine, recall_target=args.recall_target,
+         report_recall=args.report_recall, output_layout=args.output_layout,
+         shard_by=args.shard_by, compact=args.compact, precompress=args.precompress,
+         html_entry_data=args.html_entry_data, bake=args.bake,
+         bake_command=args.bake_command, bake_full=args.bake_full,
+         target_dir=args.target, sync_mode=args.sync_mode, watch=args.watch,
+         trace=args.trace, trace_top=args.trace_top)
@@ -0,0 +1,52 @@
+// static/compact.js
+//
+// Reader for the compact compiled.json schema (compile.py --compact).
+// expandEntries() turns compact entries back into the full schema, so code
+// written against the verbose file keeps working; entries already in the
+// full schema pass through untouched. Works in Node (require) and the
+// browser (window.CompactEntries).
+
+(function (root) {
+    function expandPath(path, base) {
+        if (path.startsWith('/')) return path.substring(1);
+        return path.includes('/') ? path : base + path;
+    }
+
+    function expandDimensions(dims, base) {
+        const expanded = { width: dims[0], height: dims[1] };
+        if (dims[2]) {
+            expanded.variants = dims[2].map(([path, format, width, height, bytes]) => ({
+                path: expandPath(path, base), format, width, height, bytes
+            }));
+        }
+        return expanded;
+    }
+
+    function expandEntry(entry) {
+        if (!('base' in entry)) return entry;
+
+        const { base, file_paths, dimensions, media_dimensions, ...rest } = entry;
+        const filePaths = (file_paths || []).map(path => expandPath(path, base));
+        const mediaDimensions = {};
+        filePaths.forEach((path, i) => {
+            if (dimensions && dimensions[i]) {
+                mediaDimensions[path] = expandDimensions(dimensions[i], base);
+            }
+        });
+        for (const [path, dims] of Object.entries(media_dimensions || {})) {
+            mediaDimensions[expandPath(path, base)] = expandDimensions(dims, base);
+        }
+        return { ...rest, media_dimensions: mediaDimensions, file_paths: filePaths };
+    }
+
+    function expandEntries(entries) {
+        return entries.map(expandEntry);
+    }
+
+    const api = { expandEntry, expandEntries };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.CompactEntries = api;
+    }
+})(typeof window !== 'undefined' ? window : this);